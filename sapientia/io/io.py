@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 
+import hashlib
 import json
 import os
 from pathlib import Path
@@ -73,3 +74,17 @@ def write_json_file(path, content):
     with open(path, 'w+') as file:  # open file
         json.dump(content, file, indent=4)  # write content and indent JSON file
         file.close()
+
+
+def file_digest(path, block_size=1 << 20):
+    """
+    Compute the SHA-256 digest of a file content
+    :param path: file path
+    :param block_size: size of the blocks read from the file
+    :return: hexadecimal digest
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:  # read the file by blocks to keep memory bounded
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
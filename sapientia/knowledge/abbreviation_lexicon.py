@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+import mmap
+import os
+import re
+import struct
+import tempfile
+import zlib
+
+from sapientia.knowledge.knowledge_extraction import get_abbreviations
+
+# binary format: header (magic, number of slots, number of entries), hash table slots (key offset, key length,
+# expansion offset, expansion length) and UTF-8 strings
+lexicon_magic = b"SAPABBR1"
+lexicon_header = struct.Struct("<8sII")
+lexicon_slot = struct.Struct("<IIII")
+word_pattern = re.compile(r"[^\s,;:()\[\]]+")
+
+
+def get_slot(key, nb_slots):
+    """
+    Get the first hash table slot of a key
+    :param key: key (UTF-8 encoded)
+    :param nb_slots: number of slots (power of two)
+    :return: slot index
+    """
+    return zlib.crc32(key) & (nb_slots - 1)
+
+
+def compile_abbreviations(abbreviations_file, lexicon_file):
+    """
+    Compile abbreviations from CSV file into a binary lexicon (hash table) that can be memory-mapped
+    :param abbreviations_file: csv file containing all abbreviations
+    :param lexicon_file: binary lexicon file
+    :return: None
+    """
+    abbreviations = {key: value for key, value in get_abbreviations(abbreviations_file).items() if key}
+    nb_slots = 1
+    while nb_slots < 2 * len(abbreviations):  # load factor below 0.5
+        nb_slots *= 2
+    slots = [(0, 0, 0, 0)] * nb_slots  # empty slots have a null key length
+    strings = bytearray()
+    for key, value in abbreviations.items():
+        encoded_key = key.encode("utf-8")
+        encoded_value = value.encode("utf-8")
+        slot = get_slot(encoded_key, nb_slots)
+        while slots[slot][1] != 0:  # linear probing
+            slot = (slot + 1) & (nb_slots - 1)
+        slots[slot] = (len(strings), len(encoded_key), len(strings) + len(encoded_key), len(encoded_value))
+        strings += encoded_key + encoded_value
+    directory = os.path.dirname(os.path.abspath(lexicon_file))
+    os.makedirs(directory, exist_ok=True)
+    # each process compiles into its own temporary file, processes never map a partially written lexicon
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(lexicon_header.pack(lexicon_magic, nb_slots, len(abbreviations)))
+            for slot in slots:
+                file.write(lexicon_slot.pack(*slot))
+            file.write(strings)
+        os.replace(temporary_path, lexicon_file)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+class AbbreviationLexicon:
+    """
+    Read-only abbreviation lexicon memory-mapped from a binary lexicon file (pages are shared between the processes
+    using the same lexicon), with constant time lookup
+    """
+
+    def __init__(self, lexicon_file):
+        """
+        Open a binary lexicon
+        :param lexicon_file: binary lexicon file (created with compile_abbreviations)
+        """
+        self.lexicon_file = lexicon_file
+        with open(lexicon_file, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.nb_slots, self.nb_entries = lexicon_header.unpack_from(self.data, 0)
+        if magic != lexicon_magic:
+            raise ValueError(lexicon_file, " is not an abbreviation lexicon")
+        self.strings_offset = lexicon_header.size + self.nb_slots * lexicon_slot.size
+
+    def __getstate__(self):
+        return self.lexicon_file  # workers map the lexicon file again instead of copying it
+
+    def __setstate__(self, lexicon_file):
+        self.__init__(lexicon_file)
+
+    def get_string(self, offset, length):
+        """
+        Get a string of the lexicon
+        :param offset: string offset
+        :param length: string length (in bytes)
+        :return: string
+        """
+        start = self.strings_offset + offset
+        return self.data[start:start + length].decode("utf-8")
+
+    def get(self, abbreviation, default=None):
+        """
+        Get the expansion of an abbreviation
+        :param abbreviation: abbreviation
+        :param default: value returned if the abbreviation is unknown
+        :return: expansion of the abbreviation
+        """
+        key = abbreviation.encode("utf-8")
+        slot = get_slot(key, self.nb_slots)
+        while True:
+            key_offset, key_length, value_offset, value_length = lexicon_slot.unpack_from(
+                self.data, lexicon_header.size + slot * lexicon_slot.size)
+            if key_length == 0:
+                return default
+            if key_length == len(key):
+                start = self.strings_offset + key_offset
+                if self.data[start:start + key_length] == key:
+                    return self.get_string(value_offset, value_length)
+            slot = (slot + 1) & (self.nb_slots - 1)
+
+    def __getitem__(self, abbreviation):
+        expansion = self.get(abbreviation)
+        if expansion is None:
+            raise KeyError(abbreviation)
+        return expansion
+
+    def __contains__(self, abbreviation):
+        return self.get(abbreviation) is not None
+
+    def __len__(self):
+        return self.nb_entries
+
+    def items(self):
+        """
+        Get abbreviations and their expansion
+        :return: generator of (abbreviation, expansion) tuples
+        """
+        for slot in range(self.nb_slots):
+            key_offset, key_length, value_offset, value_length = lexicon_slot.unpack_from(
+                self.data, lexicon_header.size + slot * lexicon_slot.size)
+            if key_length != 0:
+                yield self.get_string(key_offset, key_length), self.get_string(value_offset, value_length)
+
+    def expand(self, word):
+        """
+        Expand a word if it is an abbreviation
+        :param word: word
+        :return: expansion of the word if it is an abbreviation, the word itself otherwise
+        """
+        return self.get(word, word)
+
+    def expand_text(self, text):
+        """
+        Expand abbreviations in a text
+        :param text: text
+        :return: text with expanded abbreviations
+        """
+        return word_pattern.sub(lambda match: self.get(match.group(0), match.group(0)), text)
+
+    def close(self):
+        """
+        Unmap the lexicon
+        :return: None
+        """
+        self.data.close()
+
+
+def load_abbreviation_lexicon(abbreviations_file, lexicon_file=None):
+    """
+    Load the abbreviation lexicon of a CSV file, compiling it if it doesn't exist or is older than the CSV file
+    :param abbreviations_file: csv file containing all abbreviations
+    :param lexicon_file: binary lexicon file (next to the csv file by default)
+    :return: abbreviation lexicon
+    """
+    if lexicon_file is None:
+        lexicon_file = os.path.splitext(abbreviations_file)[0] + ".lexicon"
+    if not os.path.exists(lexicon_file) or os.path.getmtime(lexicon_file) < os.path.getmtime(abbreviations_file):
+        compile_abbreviations(abbreviations_file, lexicon_file)
+    return AbbreviationLexicon(lexicon_file)
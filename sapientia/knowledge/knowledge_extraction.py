@@ -1,23 +1,32 @@
 #!/usr/bin/env python
 
 import csv
+import re
 
-from sapientia.nlp.preprocessing.data_cleaning import sentences_cleaning
+modal_verbs = ["shall", "should", "must", "will", "may"]  # modal verbs expressing requirements
+modal_verbs_pattern = re.compile(r"\b(" + "|".join(modal_verbs) + r")\b")  # whole words only (not "mayor")
+
+
+def classify_requirements(sentences):
+    """
+    Classify sentences as requirements
+    :param sentences: cleaned sentences in a text (any iterable, consumed lazily)
+    :return: generator of (sentence offset, sentence, modal verb) tuples for each requirement
+    """
+    search = modal_verbs_pattern.search
+    for offset, sentence in enumerate(sentences):
+        match = search(sentence)
+        if match is not None:
+            yield offset, sentence, match.group(1)
 
 
 def requirements_extraction(sentences):
     """
     Extract requirements from sentences
-    :param sentences: sentences in a text
+    :param sentences: cleaned sentences in a text
     :return: requirements
     """
-    requirements = []
-    sentences = sentences_cleaning(sentences)
-    for sentence in sentences:
-        if ("shall" in sentence) or ("should" in sentence) or ("must" in sentence) or ("will" in sentence) \
-                or ("may" in sentence):
-            requirements.append(sentence)
-    return requirements
+    return [sentence for offset, sentence, modal_verb in classify_requirements(sentences)]
 
 
 def get_abbreviations(abbreviations_file):
@@ -1,9 +1,18 @@
 #!/usr/bin/env python
 
-from langdetect import detect, DetectorFactory
+import hashlib
+import re
+from collections import OrderedDict
+
+from langdetect import detect, detect_langs, DetectorFactory
+from langdetect.lang_detect_exception import LangDetectException, ErrorCode
 
 DetectorFactory.seed = 0
 
+detection_cache = OrderedDict()  # languages detected in texts, by text digest (least recently used first)
+detection_cache_size = 4096
+paragraph_pattern = re.compile(r"\S[^\n]*(?:\n[^\S\n]*\S[^\n]*)*")  # consecutive non-empty lines
+
 
 def detect_language(text):
     """
@@ -12,3 +21,121 @@ def detect_language(text):
     :return: main language used in a text
     """
     return detect(text)
+
+
+def van_der_corput(i):
+    """
+    Get the i-th element of the van der Corput sequence (base 2), spreading positions evenly over [0, 1)
+    :param i: index
+    :return: position in [0, 1) (0, 0.5, 0.25, 0.75, 0.125...)
+    """
+    position = 0.0
+    denominator = 1.0
+    while i:
+        denominator *= 2
+        i, remainder = divmod(i, 2)
+        position += remainder / denominator
+    return position
+
+
+def sample_windows(text, sample_size, window_size):
+    """
+    Sample windows spread over a text, the first windows covering the text coarsely and the next ones refining it
+    :param text: text
+    :param sample_size: maximum number of characters sampled
+    :param window_size: number of characters of each window (at most sample_size)
+    :return: generator of windows (at least one)
+    """
+    if sample_size <= 0 or window_size <= 0:
+        raise ValueError((sample_size, window_size), " invalid sample or window size")
+    window_size = min(window_size, sample_size)
+    if len(text) <= sample_size or len(text) <= window_size:
+        yield text
+        return
+    last_start = len(text) - window_size
+    for i in range(sample_size // window_size):
+        start = int(van_der_corput(i) * last_start)
+        space = text.find(" ", start, start + window_size // 10)  # avoid starting in the middle of a word
+        if space != -1:
+            start = space + 1
+        yield text[start:start + window_size]
+
+
+def detect_language_sampled(text, sample_size=5000, window_size=500, threshold=0.95, min_windows=2):
+    """
+    Detect main language used in a text from windows sampled over the text, stopping as soon as the language is
+    detected with enough confidence (detection time doesn't depend on the size of the text)
+    :param text: text
+    :param sample_size: maximum number of characters sampled
+    :param window_size: number of characters of each window
+    :param threshold: probability above which the detection stops
+    :param min_windows: minimum number of windows used before the detection can stop
+    :return: main language used in the text and its probability
+    """
+    digest = hashlib.sha1(text.encode("utf-8", "surrogatepass")).hexdigest()
+    key = (digest, sample_size, window_size, threshold, min_windows)
+    if key in detection_cache:
+        detection_cache.move_to_end(key)
+        return detection_cache[key]
+    scores = {}
+    total = 0
+    nb_windows = 0
+    for window in sample_windows(text, sample_size, window_size):
+        try:
+            languages = detect_langs(window)
+        except LangDetectException:  # no feature in the window
+            continue
+        nb_windows += 1
+        for language in languages:  # probabilities are weighted by the size of the windows
+            scores[language.lang] = scores.get(language.lang, 0.0) + language.prob * len(window)
+        total += len(window)
+        best = max(scores, key=scores.get)
+        if nb_windows >= min_windows and scores[best] / total >= threshold:
+            break
+    if not scores:
+        raise LangDetectException(ErrorCode.CantDetectError, "No features in text.")
+    best = max(scores, key=scores.get)
+    result = (best, scores[best] / total)
+    detection_cache[key] = result
+    if len(detection_cache) > detection_cache_size:
+        detection_cache.popitem(last=False)
+    return result
+
+
+def detect_language_segments(text, min_segment_size=200, sample_size=2000, window_size=200):
+    """
+    Detect languages used in the segments of a text (for texts mixing several languages)
+    Consecutive paragraphs are grouped into segments of at least min_segment_size characters before detection, and
+    consecutive segments in the same language are merged.
+    :param text: text
+    :param min_segment_size: minimum number of characters of a segment
+    :param sample_size: maximum number of characters sampled in each segment
+    :param window_size: number of characters of each window sampled in a segment
+    :return: language spans (start character, end character and language, None if it can't be detected)
+    """
+    segments = []
+    segment_start = None
+    segment_end = None
+    for paragraph in paragraph_pattern.finditer(text):
+        if segment_start is None:
+            segment_start = paragraph.start()
+        segment_end = paragraph.end()
+        if segment_end - segment_start >= min_segment_size:
+            segments.append((segment_start, segment_end))
+            segment_start = None
+    if segment_start is not None:
+        if segments and segment_end - segment_start < min_segment_size:  # too short, merged with previous segment
+            segments[-1] = (segments[-1][0], segment_end)
+        else:
+            segments.append((segment_start, segment_end))
+    spans = []
+    for start, end in segments:
+        try:
+            language = detect_language_sampled(text[start:end], sample_size=sample_size, window_size=window_size)[0]
+        except LangDetectException:  # no feature in the segment
+            language = None
+        if spans and spans[-1][2] == language:
+            spans[-1] = (spans[-1][0], end, language)
+        else:
+            spans.append((start, end, language))
+    return spans
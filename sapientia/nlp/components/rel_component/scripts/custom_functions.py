@@ -11,6 +11,8 @@ from scripts.rel_pipe import make_relation_extractor
 # make the config work
 from scripts.rel_model import create_relation_model, create_classification_layer, create_instances, create_tensors
 
+from scripts.parse_data_generic import get_docbin_files
+
 
 @spacy.registry.readers("Gold_ents_Corpus.v1")
 def create_docbin_reader(file: Path) -> Callable[["Language"], Iterable[Example]]:
@@ -19,14 +21,16 @@ def create_docbin_reader(file: Path) -> Callable[["Language"], Iterable[Example]
 
 def read_files(file: Path, nlp: "Language") -> Iterable[Example]:
     """Custom reader that keeps the tokenization of the gold data,
-    and also adds the gold GGP annotations as we do not attempt to predict these."""
-    doc_bin = DocBin().from_disk(file)
-    docs = doc_bin.get_docs(nlp.vocab)
-    for gold in docs:
-        pred = Doc(
-            nlp.vocab,
-            words=[t.text for t in gold],
-            spaces=[t.whitespace_ for t in gold],
-        )
-        pred.ents = gold.ents
-        yield Example(pred, gold)
+    and also adds the gold GGP annotations as we do not attempt to predict these.
+    The file can also be a directory of DocBin shards, read one after the other."""
+    for docbin_file in get_docbin_files(file):
+        doc_bin = DocBin().from_disk(docbin_file)
+        docs = doc_bin.get_docs(nlp.vocab)
+        for gold in docs:
+            pred = Doc(
+                nlp.vocab,
+                words=[t.text for t in gold],
+                spaces=[t.whitespace_ for t in gold],
+            )
+            pred.ents = gold.ents
+            yield Example(pred, gold)
@@ -1,4 +1,8 @@
-import random
+import json
+import time
+from typing import Optional
+
+import numpy
 import typer
 from pathlib import Path
 import spacy
@@ -6,76 +10,103 @@ from spacy.tokens import DocBin, Doc
 from spacy.training.example import Example
 
 # make the factory work
-from rel_pipe import make_relation_extractor, score_relations
+from rel_pipe import make_relation_extractor, flatten_relations, sweep_relations
 
 # make the config work
 from rel_model import create_relation_model, create_classification_layer, create_instances, create_tensors
 
+from parse_data_generic import get_docbin_files
+
 
-def main(trained_pipeline: Path, test_data: Path, print_details: bool):
+def main(
+    trained_pipeline: Path,
+    test_data: Path,
+    print_details: bool,
+    batch_size: int = typer.Option(64, help="Number of docs processed by the pipeline in each batch"),
+    report: Optional[Path] = typer.Option(None, help="JSON file where scores and timings are written"),
+):
+    timings = {}
+    start = time.perf_counter()
     nlp = spacy.load(trained_pipeline)
+    timings["load"] = time.perf_counter() - start
 
-    doc_bin = DocBin(store_user_data=True).from_disk(test_data)
-    docs = doc_bin.get_docs(nlp.vocab)
-    examples = []
-    for gold in docs:
+    # Deserialize the test data once, predictions are made on copies with the gold entities
+    start = time.perf_counter()
+    golds = []
+    for docbin_file in get_docbin_files(test_data):  # a DocBin file or a directory of shards
+        doc_bin = DocBin(store_user_data=True).from_disk(docbin_file)
+        golds.extend(doc_bin.get_docs(nlp.vocab))
+    preds = []
+    for gold in golds:
         pred = Doc(
             nlp.vocab,
             words=[t.text for t in gold],
             spaces=[t.whitespace_ for t in gold],
         )
         pred.ents = gold.ents
-        for name, proc in nlp.pipeline:
-            pred = proc(pred)
-        examples.append(Example(pred, gold))
+        preds.append(pred)
+    timings["deserialize"] = time.perf_counter() - start
 
-        # Print the gold and prediction, if gold label is not 0
-        if print_details:
+    start = time.perf_counter()
+    preds = list(nlp.pipe(preds, batch_size=batch_size))
+    examples = [Example(pred, gold) for pred, gold in zip(preds, golds)]
+    timings["predict"] = time.perf_counter() - start
+
+    # Print the gold and prediction, if gold label is not 0
+    if print_details:
+        for pred, gold in zip(preds, golds):
             print()
             print(f"Text: {gold.text}")
             print(f"spans: {[(e.start, e.text, e.label_) for e in pred.ents]}")
             for value, rel_dict in pred._.rel.items():
-                gold_labels = [k for (k, v) in gold._.rel[value].items() if v == 1.0]
+                gold_labels = [k for (k, v) in gold._.rel.get(value, {}).items() if v == 1.0]
                 if gold_labels:
                     print(
                         f" pair: {value} --> gold labels: {gold_labels} --> predicted values: {rel_dict}"
                     )
             print()
 
-    random_examples = []
-    docs = doc_bin.get_docs(nlp.vocab)
-    for gold in docs:
-        pred = Doc(
-            nlp.vocab,
-            words=[t.text for t in gold],
-            spaces=[t.whitespace_ for t in gold],
-        )
-        pred.ents = gold.ents
-        relation_extractor = nlp.get_pipe("relation_extractor")
-        get_instances = relation_extractor.model.attrs["get_instances"]
-        for (e1, e2) in get_instances(pred):
-            offset = (e1.start, e2.start)
-            if offset not in pred._.rel:
-                pred._.rel[offset] = {}
-            for label in relation_extractor.labels:
-                pred._.rel[offset][label] = random.uniform(0, 1)
-        random_examples.append(Example(pred, gold))
-
     thresholds = [0.000, 0.050, 0.100, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.99, 0.999]
+
+    # The random baseline scores the same candidate instances as the model
+    start = time.perf_counter()
+    relations = flatten_relations(examples)
+    random_relations = dict(relations, scores=numpy.random.uniform(0, 1, size=len(relations["scores"])))
+    timings["flatten"] = time.perf_counter() - start
+
+    start = time.perf_counter()
     print()
     print("Random baseline:")
-    _score_and_format(random_examples, thresholds)
+    random_results = _score_and_format(random_relations, thresholds)
+    timings["score_random_baseline"] = time.perf_counter() - start
 
+    start = time.perf_counter()
     print()
     print("Results of the trained model:")
-    _score_and_format(examples, thresholds)
+    results = _score_and_format(relations, thresholds)
+    timings["score_model"] = time.perf_counter() - start
+
+    if report is not None:
+        with open(report, "w") as report_file:
+            json.dump(
+                {
+                    "docs": len(golds),
+                    "batch_size": batch_size,
+                    "timings": timings,
+                    "random_baseline": random_results,
+                    "model": results,
+                },
+                report_file,
+                indent=2,
+            )
 
 
-def _score_and_format(examples, thresholds):
-    for threshold in thresholds:
-        r = score_relations(examples, threshold)
+def _score_and_format(relations, thresholds):
+    sweep = sweep_relations(relations, thresholds)
+    for threshold, r in zip(thresholds, sweep["micro"]):
         results = {k: "{:.2f}".format(v * 100) for k, v in r.items()}
         print(f"threshold {'{:.2f}'.format(threshold)} \t {results}")
+    return sweep
 
 
 if __name__ == "__main__":
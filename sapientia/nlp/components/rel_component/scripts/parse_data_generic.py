@@ -1,9 +1,13 @@
 # This script was derived from parse_data.py but made more generic as a template for various REL parsing needs
 
+import hashlib
 import json
-import random
 import typer
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from functools import partial
+from itertools import islice
 from pathlib import Path
+from typing import Dict, List
 
 from spacy.tokens import DocBin, Doc
 from spacy.vocab import Vocab
@@ -11,6 +15,10 @@ from wasabi import Printer
 
 msg = Printer()
 
+# Only positive relations are stored, rel_complete tells whether missing relations are negative examples
+Doc.set_extension("rel", default={}, force=True)
+Doc.set_extension("rel_complete", default=False, force=True)
+
 # TODO: define your labels used for annotation either as "symmetrical" or "directed"
 SYMM_LABELS = ["COLLABORATION", "CONNECTION", "ALTERNATIVE_LABEL"]
 DIRECTED_LABELS = ["RESPONSIBLE", "PROVIDE", "PROVIDED", "DEFINED_BY", "COMPLY_WITH", "APPROVAL", "REJECTION",
@@ -25,119 +33,186 @@ dev_portion = 0.1#0.3
 # If it's true, entities that were not annotated as related will be used as negative examples.
 is_complete = False
 
-
-def main(json_loc: Path, train_file: Path, dev_file: Path, test_file: Path):
-    """Creating the corpus from the Prodigy annotations."""
-    Doc.set_extension("rel", default={})
+SPLITS = ["train", "dev", "test"]
+
+# DocBin shards written by this script, other files of the split directories are left untouched
+SHARD_PREFIX = "rel-shard-"
+
+
+def get_source_key(example: Dict) -> str:
+    """Get the key of the source document of an annotated example, so that all the
+    sentences of a document end up in the same split."""
+    meta = example.get("meta", {})
+    for key in ("source", "file", "doc_id"):
+        if key in meta:
+            return str(meta[key])
+    if "_input_hash" in example:
+        return str(example["_input_hash"])
+    return example.get("text", "")
+
+
+def get_split(source_key: str, seed: int) -> str:
+    """Get the split of a source document, from a seeded hash of its key."""
+    digest = hashlib.sha1(f"{seed}:{source_key}".encode("utf8")).hexdigest()
+    position = int(digest[:8], 16) / 0x100000000
+    if position < test_portion:
+        return "test"
+    if position < test_portion + dev_portion:
+        return "dev"
+    return "train"
+
+
+def example_to_doc(example: Dict, vocab: Vocab):
+    """Create a Doc from a Prodigy annotation, with its entities and positive relations.
+    Returns the Doc and its number of positive and negative instances."""
+    span_starts = set()
+    # Parse the tokens
+    words = [t["text"] for t in example["tokens"]]
+    spaces = [t["ws"] for t in example["tokens"]]
+    doc = Doc(vocab, words=words, spaces=spaces)
+
+    # Parse the entities
+    spans = example["spans"]
+    entities = []
+    span_end_to_start = {}
+    for span in spans:
+        entity = doc.char_span(
+            span["start"], span["end"], label=span["label"]
+        )
+        span_end_to_start[span["token_end"]] = span["token_start"]
+        entities.append(entity)
+        span_starts.add(span["token_start"])
+    if not entities:
+        msg.warn("Could not parse any entities from the JSON file.")
+    doc.ents = entities
+
+    # Parse the relations
+    rels = {}
+    pos = 0
+    relations = example["relations"]
+    for relation in relations:
+        # Ignoring relations that are not between spans (they are annotated on the token level
+        if not relation["head"] in span_end_to_start or not relation["child"] in span_end_to_start:
+            msg.warn(f"This script only supports relationships between annotated entities.")
+            break
+        # the 'head' and 'child' annotations refer to the end token in the span
+        # but we want the first token
+        start = span_end_to_start[relation["head"]]
+        end = span_end_to_start[relation["child"]]
+        label = relation["label"]
+        if label not in SYMM_LABELS + DIRECTED_LABELS:
+            msg.warn(f"Found label '{label}' not defined in SYMM_LABELS or DIRECTED_LABELS - skipping")
+            break
+        if label not in rels.get((start, end), {}):
+            rels.setdefault((start, end), {})[label] = 1.0
+            pos += 1
+        if label in SYMM_LABELS:
+            if label not in rels.get((end, start), {}):
+                rels.setdefault((end, start), {})[label] = 1.0
+                pos += 1
+
+    # If the annotation is complete, missing relations are negative examples (they are not stored)
+    neg = len(span_starts) ** 2 * len(SYMM_LABELS + DIRECTED_LABELS) - pos if is_complete else 0
+    doc._.rel = rels
+    doc._.rel_complete = is_complete
+    return doc, pos, neg
+
+
+def convert_shard(shard: int, lines: List[str], dirs: Dict[str, Path], seed: int) -> Dict[str, Dict[str, int]]:
+    """Convert a shard of Prodigy annotations, and write a DocBin for each split in its directory.
+    Returns the number of documents, positive and all instances of each split."""
     vocab = Vocab()
-
-    docs = {"train": [], "dev": [], "test": []}
-    count_all = {"train": 0, "dev": 0, "test": 0}
-    count_pos = {"train": 0, "dev": 0, "test": 0}
-
-    with json_loc.open("r", encoding="utf8") as jsonfile:
-        for line in jsonfile:
-            example = json.loads(line)
-            span_starts = set()
-            if example["answer"] == "accept":
-                neg = 0
-                pos = 0
-                # Parse the tokens
-                words = [t["text"] for t in example["tokens"]]
-                spaces = [t["ws"] for t in example["tokens"]]
-                doc = Doc(vocab, words=words, spaces=spaces)
-
-                # Parse the entities
-                spans = example["spans"]
-                entities = []
-                span_end_to_start = {}
-                for span in spans:
-                    entity = doc.char_span(
-                        span["start"], span["end"], label=span["label"]
-                    )
-                    span_end_to_start[span["token_end"]] = span["token_start"]
-                    entities.append(entity)
-                    span_starts.add(span["token_start"])
-                if not entities:
-                    msg.warn("Could not parse any entities from the JSON file.")
-                doc.ents = entities
-
-                # Parse the relations
-                rels = {}
-                for x1 in span_starts:
-                    for x2 in span_starts:
-                        rels[(x1, x2)] = {}
-                relations = example["relations"]
-                for relation in relations:
-                    # Ignoring relations that are not between spans (they are annotated on the token level
-                    if not relation["head"] in span_end_to_start or not relation["child"] in span_end_to_start:
-                        msg.warn(f"This script only supports relationships between annotated entities.")
-                        break
-                    # the 'head' and 'child' annotations refer to the end token in the span
-                    # but we want the first token
-                    start = span_end_to_start[relation["head"]]
-                    end = span_end_to_start[relation["child"]]
-                    label = relation["label"]
-                    if label not in SYMM_LABELS + DIRECTED_LABELS:
-                        msg.warn(f"Found label '{label}' not defined in SYMM_LABELS or DIRECTED_LABELS - skipping")
-                        break
-                    if label not in rels[(start, end)]:
-                        rels[(start, end)][label] = 1.0
-                        pos += 1
-                    if label in SYMM_LABELS:
-                        if label not in rels[(end, start)]:
-                            rels[(end, start)][label] = 1.0
-                            pos += 1
-
-                # If the annotation is complete, fill in zero's where the data is missing
-                if is_complete:
-                    for x1 in span_starts:
-                        for x2 in span_starts:
-                            for label in SYMM_LABELS + DIRECTED_LABELS:
-                                if label not in rels[(x1, x2)]:
-                                    neg += 1
-                                    rels[(x1, x2)][label] = 0.0
-                doc._.rel = rels
-
-                # only keeping documents with at least 1 positive case
-                if pos > 0:
-                    # create the train/dev/test split randomly
-                    # Note that this is not good practice as instances from the same article
-                    # may end up in different splits. Ideally, change this method to keep
-                    # documents together in one split (as in the original parse_data.py)
-                    if random.random() < test_portion:
-                        docs["test"].append(doc)
-                        count_pos["test"] += pos
-                        count_all["test"] += pos + neg
-                    elif random.random() < (test_portion + dev_portion):
-                        docs["dev"].append(doc)
-                        count_pos["dev"] += pos
-                        count_all["dev"] += pos + neg
-                    else:
-                        docs["train"].append(doc)
-                        count_pos["train"] += pos
-                        count_all["train"] += pos + neg
-
-    docbin = DocBin(docs=docs["train"], store_user_data=True)
-    docbin.to_disk(train_file)
-    msg.info(
-        f"{len(docs['train'])} training sentences, "
-        f"{count_pos['train']}/{count_all['train']} pos instances."
+    docs = {split: [] for split in SPLITS}
+    counts = {split: {"docs": 0, "pos": 0, "all": 0} for split in SPLITS}
+    for line in lines:
+        example = json.loads(line)
+        if example["answer"] != "accept":
+            continue
+        doc, pos, neg = example_to_doc(example, vocab)
+        # only keeping documents with at least 1 positive case
+        if pos > 0:
+            split = get_split(get_source_key(example), seed)
+            docs[split].append(doc)
+            counts[split]["docs"] += 1
+            counts[split]["pos"] += pos
+            counts[split]["all"] += pos + neg
+    for split in SPLITS:
+        if docs[split]:
+            DocBin(docs=docs[split], store_user_data=True).to_disk(dirs[split] / get_shard_name(shard))
+    return counts
+
+
+def get_shard_name(shard: int) -> str:
+    """Get the file name of a DocBin shard."""
+    return f"{SHARD_PREFIX}{shard:05d}.spacy"
+
+
+def get_shard_files(directory: Path) -> List[Path]:
+    """Get the DocBin shards written by this script in a directory, in the order of the shards."""
+    return sorted(
+        path for path in Path(directory).glob(f"{SHARD_PREFIX}*.spacy")
+        if path.stem[len(SHARD_PREFIX):].isdigit()
     )
 
-    docbin = DocBin(docs=docs["dev"], store_user_data=True)
-    docbin.to_disk(dev_file)
-    msg.info(
-        f"{len(docs['dev'])} dev sentences, "
-        f"{count_pos['dev']}/{count_all['dev']} pos instances."
-    )
 
-    docbin = DocBin(docs=docs["test"], store_user_data=True)
-    docbin.to_disk(test_file)
-    msg.info(
-        f"{len(docs['test'])} test sentences, "
-        f"{count_pos['test']}/{count_all['test']} pos instances."
-    )
+def get_docbin_files(path: Path) -> List[Path]:
+    """Get the DocBin files of a corpus: the file itself, or the shards of a directory."""
+    path = Path(path)
+    if path.is_dir():
+        return get_shard_files(path)
+    return [path]
+
+
+def main(
+    json_loc: Path,
+    train_file: Path,
+    dev_file: Path,
+    test_file: Path,
+    workers: int = typer.Option(1, help="Number of processes converting annotations"),
+    shard_size: int = typer.Option(1000, help="Number of annotations in each shard"),
+    seed: int = typer.Option(0, help="Seed of the train/dev/test split"),
+):
+    """Creating the corpus from the Prodigy annotations.
+    Each split is written as a directory of DocBin shards, annotations are read and converted shard by shard."""
+    dirs = {"train": train_file, "dev": dev_file, "test": test_file}
+    for directory in dirs.values():
+        if directory.exists() and not directory.is_dir():
+            msg.fail(f"{directory} is an existing file, the splits are written as directories of DocBin shards. "
+                     f"Remove it or choose another path.", exits=1)
+    for directory in dirs.values():
+        directory.mkdir(parents=True, exist_ok=True)
+        for shard_file in get_shard_files(directory):  # shards of a previous conversion
+            shard_file.unlink()
+    counts = {split: {"docs": 0, "pos": 0, "all": 0} for split in SPLITS}
+
+    def add_counts(shard_counts):
+        for split in SPLITS:
+            for key, value in shard_counts[split].items():
+                counts[split][key] += value
+
+    convert = partial(convert_shard, dirs=dirs, seed=seed)
+    with json_loc.open("r", encoding="utf8") as jsonfile:
+        shards = enumerate(iter(lambda: list(islice(jsonfile, shard_size)), []))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                in_flight = set()
+                for shard, lines in shards:
+                    if len(in_flight) >= 2 * workers:  # bounds the number of shards held in memory
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            add_counts(future.result())
+                    in_flight.add(executor.submit(convert, shard, lines))
+                for future in in_flight:
+                    add_counts(future.result())
+        else:
+            for shard, lines in shards:
+                add_counts(convert(shard, lines))
+
+    for split, name in (("train", "training"), ("dev", "dev"), ("test", "test")):
+        msg.info(
+            f"{counts[split]['docs']} {name} sentences, "
+            f"{counts[split]['pos']}/{counts[split]['all']} pos instances."
+        )
 
 
 if __name__ == "__main__":
@@ -1,5 +1,6 @@
-from typing import List, Tuple, Callable
+from typing import List, Tuple, Callable, Optional
 
+import numpy
 import spacy
 from spacy.tokens import Doc, Span
 from thinc.types import Floats2d, Ints1d, Ragged, cast
@@ -26,26 +27,69 @@ def create_classification_layer(
 
 
 @spacy.registry.misc("rel_instance_generator.v1")
-def create_instances(max_length: int) -> Callable[[Doc], List[Tuple[Span, Span]]]:
+def create_instances(
+    max_length: int, label_pairs: Optional[List[List[str]]] = None
+) -> Callable[[Doc], List[Tuple[Span, Span]]]:
+    allowed_label_pairs = {tuple(label_pair) for label_pair in label_pairs} if label_pairs else None
+    # The candidate instances of a Doc are computed once and reused by prediction, annotation, loss and
+    # backprop: the indices of their entities are kept in doc.user_data with the entities they were computed
+    # from, so they are computed again when doc.ents change, and they are released with the Doc.
+    cache_key = ("rel_instances", max_length, tuple(sorted(allowed_label_pairs or ())))
+
     def get_instances(doc: Doc) -> List[Tuple[Span, Span]]:
-        instances = []
-        for ent1 in doc.ents:
-            for ent2 in doc.ents:
-                if ent1 != ent2:
-                    if max_length and abs(ent2.start - ent1.start) <= max_length:
-                        instances.append((ent1, ent2))
-        return instances
+        ents = doc.ents
+        ents_key = [[ent.start, ent.end, ent.label] for ent in ents]
+        entry = doc.user_data.get(cache_key)
+        if entry is not None and entry[0] == ents_key:
+            firsts, seconds = entry[1], entry[2]
+        else:
+            firsts, seconds = get_instance_entity_indices(ents)
+            # plain lists, so the user data of the Doc can still be serialized
+            doc.user_data[cache_key] = (ents_key, firsts, seconds)
+        return [(ents[i], ents[j]) for i, j in zip(firsts, seconds)]
+
+    def get_instance_entity_indices(ents: Tuple[Span, ...]) -> Tuple[List[int], List[int]]:
+        if not max_length or len(ents) < 2:
+            return [], []
+        starts = numpy.fromiter((ent.start for ent in ents), dtype="int64", count=len(ents))
+        firsts, seconds = get_instance_indices(starts, max_length)
+        if allowed_label_pairs is not None:
+            labels = [ent.label_ for ent in ents]
+            unique_labels = sorted(set(labels))
+            label_index = {label: i for i, label in enumerate(unique_labels)}
+            label_ids = numpy.asarray([label_index[label] for label in labels], dtype="int64")
+            allowed = numpy.zeros((len(unique_labels), len(unique_labels)), dtype="bool")
+            for i, label1 in enumerate(unique_labels):
+                for j, label2 in enumerate(unique_labels):
+                    allowed[i, j] = (label1, label2) in allowed_label_pairs
+            keep = allowed[label_ids[firsts], label_ids[seconds]]
+            firsts, seconds = firsts[keep], seconds[keep]
+        return firsts.tolist(), seconds.tolist()
 
     return get_instances
 
 
+def get_instance_indices(starts: numpy.ndarray, max_length: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Get the indices of all pairs of distinct entities starting at most max_length
+    tokens apart, ordered by first then second entity. Entity starts must be sorted:
+    the window of candidates of each entity is found with a binary search, so only
+    pairs within max_length are generated."""
+    lows = numpy.searchsorted(starts, starts - max_length, side="left")
+    highs = numpy.searchsorted(starts, starts + max_length, side="right")
+    counts = highs - lows
+    offsets = numpy.cumsum(counts) - counts
+    firsts = numpy.repeat(numpy.arange(len(starts)), counts)
+    seconds = numpy.arange(counts.sum()) - numpy.repeat(offsets - lows, counts)
+    different = firsts != seconds
+    return firsts[different], seconds[different]
+
+
 @spacy.registry.architectures("rel_instance_tensor.v1")
 def create_tensors(
     tok2vec: Model[List[Doc], List[Floats2d]],
     pooling: Model[Ragged, Floats2d],
     get_instances: Callable[[Doc], List[Tuple[Span, Span]]],
 ) -> Model[List[Doc], Floats2d]:
-
     return Model(
         "instance_tensors",
         instance_forward,
@@ -56,6 +100,13 @@ def create_tensors(
     )
 
 
+def get_span_token_indices(starts: numpy.ndarray, ends: numpy.ndarray) -> numpy.ndarray:
+    """Get the indices of the tokens of the spans [start, end), span after span."""
+    lengths = ends - starts
+    offsets = numpy.cumsum(lengths) - lengths
+    return numpy.arange(lengths.sum()) - numpy.repeat(offsets - starts, lengths)
+
+
 def instance_forward(model: Model[List[Doc], Floats2d], docs: List[Doc], is_train: bool) -> Tuple[Floats2d, Callable]:
     pooling = model.get_ref("pooling")
     tok2vec = model.get_ref("tok2vec")
@@ -63,39 +114,38 @@ def instance_forward(model: Model[List[Doc], Floats2d], docs: List[Doc], is_trai
     all_instances = [get_instances(doc) for doc in docs]
     tokvecs, bp_tokvecs = tok2vec(docs, is_train)
 
-    ents = []
-    lengths = []
-
-    for doc_nr, (instances, tokvec) in enumerate(zip(all_instances, tokvecs)):
-        token_indices = []
+    # Token vectors of all docs are concatenated, entity spans are shifted accordingly.
+    # Each entity is pooled once, pairs are made by indexing the pooled entities.
+    doc_lengths = [tokvec.shape[0] for tokvec in tokvecs]
+    doc_offsets = numpy.cumsum(doc_lengths) - doc_lengths
+    span_ids = {}
+    pair_ids = []
+    for instances, doc_offset in zip(all_instances, doc_offsets.tolist()):
         for instance in instances:
             for ent in instance:
-                token_indices.extend([i for i in range(ent.start, ent.end)])
-                lengths.append(ent.end - ent.start)
-        ents.append(tokvec[token_indices])
-    lengths = cast(Ints1d, model.ops.asarray(lengths, dtype="int32"))
-    entities = Ragged(model.ops.flatten(ents), lengths)
+                span = (ent.start + doc_offset, ent.end + doc_offset)
+                pair_ids.append(span_ids.setdefault(span, len(span_ids)))
+    spans = numpy.asarray(list(span_ids), dtype="int64").reshape(-1, 2)
+    token_indices = get_span_token_indices(spans[:, 0], spans[:, 1])
+    indices = model.ops.asarray1i(token_indices)
+    pair_indices = model.ops.asarray1i(pair_ids)
+    lengths = cast(Ints1d, model.ops.asarray1i(spans[:, 1] - spans[:, 0]))
+    all_tokvecs = model.ops.flatten(tokvecs)
+    entities = Ragged(all_tokvecs[indices], lengths)
     pooled, bp_pooled = pooling(entities, is_train)
 
     # Reshape so that pairs of rows are concatenated
-    relations = model.ops.reshape2f(pooled, -1, pooled.shape[1] * 2)
+    relations = model.ops.reshape2f(pooled[pair_indices], -1, pooled.shape[1] * 2)
 
     def backprop(d_relations: Floats2d) -> List[Doc]:
-        d_pooled = model.ops.reshape2f(d_relations, d_relations.shape[0] * 2, -1)
+        d_pairs = model.ops.reshape2f(d_relations, d_relations.shape[0] * 2, -1)
+        # Entities are shared by pairs and don't overlap: gradients are summed
+        d_pooled = model.ops.alloc2f(*pooled.shape)
+        model.ops.scatter_add(d_pooled, pair_indices, d_pairs)
         d_ents = bp_pooled(d_pooled).data
-        d_tokvecs = []
-        ent_index = 0
-        for doc_nr, instances in enumerate(all_instances):
-            shape = tokvecs[doc_nr].shape
-            d_tokvec = model.ops.alloc2f(*shape)
-            count_occ = model.ops.alloc2f(*shape)
-            for instance in instances:
-                for ent in instance:
-                    d_tokvec[ent.start : ent.end] += d_ents[ent_index]
-                    count_occ[ent.start : ent.end] += 1
-                    ent_index += ent.end - ent.start
-            d_tokvec /= count_occ + 0.00000000001
-            d_tokvecs.append(d_tokvec)
+        d_all_tokvecs = model.ops.alloc2f(*all_tokvecs.shape)
+        model.ops.scatter_add(d_all_tokvecs, indices, d_ents)
+        d_tokvecs = model.ops.unflatten(d_all_tokvecs, model.ops.asarray1i(doc_lengths))
 
         d_docs = bp_tokvecs(d_tokvecs)
         return d_docs
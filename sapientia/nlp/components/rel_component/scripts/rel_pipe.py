@@ -1,7 +1,6 @@
 from itertools import islice
 from typing import Tuple, List, Iterable, Optional, Dict, Callable, Any
 
-from spacy.scorer import PRFScore
 from thinc.types import Floats2d
 import numpy
 from spacy.training.example import Example
@@ -15,6 +14,8 @@ from wasabi import Printer
 
 
 Doc.set_extension("rel", default={}, force=True)
+# scores of all the candidate instances: labels, (n_pairs, 2) array of entity starts and (n_pairs, n_labels) scores
+Doc.set_extension("rel_scores", default=None, force=True)
 msg = Printer()
 
 
@@ -29,10 +30,10 @@ msg = Printer()
     },
 )
 def make_relation_extractor(
-    nlp: Language, name: str, model: Model, *, threshold: float
+    nlp: Language, name: str, model: Model, *, threshold: float, sparse: bool = False
 ):
     """Construct a RelationExtractor component."""
-    return RelationExtractor(nlp.vocab, model, name, threshold=threshold)
+    return RelationExtractor(nlp.vocab, model, name, threshold=threshold, sparse=sparse)
 
 
 class RelationExtractor(TrainablePipe):
@@ -43,12 +44,15 @@ class RelationExtractor(TrainablePipe):
         name: str = "rel",
         *,
         threshold: float,
+        sparse: bool = False,
     ) -> None:
-        """Initialize a relation extractor."""
+        """Initialize a relation extractor. Scores of all the candidate instances are
+        stored as arrays in doc._.rel_scores. With sparse, doc._.rel only keeps the
+        labels scored above the threshold, otherwise it holds all the scores."""
         self.vocab = vocab
         self.model = model
         self.name = name
-        self.cfg = {"labels": [], "threshold": threshold}
+        self.cfg = {"labels": [], "threshold": threshold, "sparse": sparse}
 
     @property
     def labels(self) -> Tuple[str]:
@@ -60,6 +64,11 @@ class RelationExtractor(TrainablePipe):
         """Returns the threshold above which a prediction is seen as 'True'."""
         return self.cfg["threshold"]
 
+    @property
+    def sparse(self) -> bool:
+        """Returns whether only the labels above the threshold are kept in doc._.rel."""
+        return self.cfg["sparse"]
+
     def add_label(self, label: str) -> int:
         """Add a new label to the pipe."""
         if not isinstance(label, str):
@@ -70,23 +79,20 @@ class RelationExtractor(TrainablePipe):
         return 1
 
     def __call__(self, doc: Doc) -> Doc:
-        """Apply the pipe to a Doc."""
-        # check that there are actually any candidate instances in this batch of examples
-        total_instances = len(self.model.attrs["get_instances"](doc))
-        if total_instances == 0:
-            msg.info("Could not determine any instances in doc - returning doc as is.")
-            return doc
-
+        """Apply the pipe to a Doc. The model doesn't run when there are no candidate
+        instances, the Doc is annotated with empty scores as in the batched path."""
         predictions = self.predict([doc])
         self.set_annotations([doc], predictions)
         return doc
 
     def predict(self, docs: Iterable[Doc]) -> Floats2d:
-        """Apply the pipeline's model to a batch of docs, without modifying them."""
+        """Apply the pipeline's model to a batch of docs, without modifying them.
+        The model only runs over the docs with candidate instances."""
         get_instances = self.model.attrs["get_instances"]
-        total_instances = sum([len(get_instances(doc)) for doc in docs])
-        if total_instances == 0:
+        docs = [doc for doc in docs if len(get_instances(doc)) > 0]
+        if not docs:
             msg.info("Could not determine any instances in any docs - can not make any predictions.")
+            return self.model.ops.alloc2f(0, len(self.labels))
         scores = self.model.predict(docs)
         return self.model.ops.asarray(scores)
 
@@ -94,14 +100,26 @@ class RelationExtractor(TrainablePipe):
         """Modify a batch of `Doc` objects, using pre-computed scores."""
         c = 0
         get_instances = self.model.attrs["get_instances"]
+        labels = list(self.labels)
+        scores = self.model.ops.to_numpy(scores)
         for doc in docs:
-            for (e1, e2) in get_instances(doc):
-                offset = (e1.start, e2.start)
-                if offset not in doc._.rel:
-                    doc._.rel[offset] = {}
-                for j, label in enumerate(self.labels):
-                    doc._.rel[offset][label] = scores[c, j]
-                c += 1
+            instances = get_instances(doc)
+            doc_scores = numpy.array(scores[c : c + len(instances)], dtype="f")
+            c += len(instances)
+            offsets = [(e1.start, e2.start) for (e1, e2) in instances]
+            doc._.rel_scores = {
+                "labels": labels,
+                "pairs": numpy.asarray(offsets, dtype="i").reshape(-1, 2),
+                "scores": doc_scores,
+            }
+            # a new dict is assigned, the default value is shared by all docs
+            if self.sparse:
+                rel = {}
+                for i, j in zip(*numpy.nonzero(doc_scores >= self.threshold)):
+                    rel.setdefault(offsets[i], {})[labels[j]] = float(doc_scores[i, j])
+            else:
+                rel = {offset: dict(zip(labels, row)) for offset, row in zip(offsets, doc_scores.tolist())}
+            doc._.rel = rel
 
     def update(
         self,
@@ -178,16 +196,16 @@ class RelationExtractor(TrainablePipe):
 
     def _examples_to_truth(self, examples: List[Example]) -> Optional[numpy.ndarray]:
         # check that there are actually any candidate instances in this batch of examples
-        nr_instances = 0
-        for eg in examples:
-            nr_instances += len(self.model.attrs["get_instances"](eg.reference))
+        get_instances = self.model.attrs["get_instances"]
+        all_instances = [get_instances(eg.reference) for eg in examples]
+        nr_instances = sum(len(instances) for instances in all_instances)
         if nr_instances == 0:
             return None
 
         truths = numpy.zeros((nr_instances, len(self.labels)), dtype="f")
         c = 0
-        for i, eg in enumerate(examples):
-            for (e1, e2) in self.model.attrs["get_instances"](eg.reference):
+        for eg, instances in zip(examples, all_instances):
+            for (e1, e2) in instances:
                 gold_label_dict = eg.reference._.rel.get((e1.start, e2.start), {})
                 for j, label in enumerate(self.labels):
                     truths[c, j] = gold_label_dict.get(label, 0)
@@ -201,25 +219,120 @@ class RelationExtractor(TrainablePipe):
         return score_relations(examples, self.threshold)
 
 
-def score_relations(examples: Iterable[Example], threshold: float) -> Dict[str, Any]:
-    """Score a batch of examples."""
-    micro_prf = PRFScore()
+def flatten_relations(examples: Iterable[Example]) -> Dict[str, Any]:
+    """Flatten the predicted relations of examples, one row for each predicted score of
+    a pair and a label: score, whether the label is in the gold labels of the pair, and label id.
+    The compact scores in doc._.rel_scores are used when they are available."""
+    scores = []
+    is_gold = []
+    label_ids = []
+    label_index = {}
     for example in examples:
         gold = example.reference._.rel
-        pred = example.predicted._.rel
-        for key, pred_dict in pred.items():
-            gold_labels = [k for (k, v) in gold.get(key, {}).items() if v == 1.0]
+        pred = example.predicted
+        if pred._.rel_scores is not None:
+            labels = pred._.rel_scores["labels"]
+            ids = [label_index.setdefault(label, len(label_index)) for label in labels]
+            for key, row in zip(pred._.rel_scores["pairs"].tolist(), pred._.rel_scores["scores"].tolist()):
+                gold_dict = gold.get(tuple(key), {})
+                scores.extend(row)
+                is_gold.extend([gold_dict.get(label) == 1.0 for label in labels])
+                label_ids.extend(ids)
+            continue
+        for key, pred_dict in pred._.rel.items():
+            gold_dict = gold.get(key, {})
             for k, v in pred_dict.items():
-                if v >= threshold:
-                    if k in gold_labels:
-                        micro_prf.tp += 1
-                    else:
-                        micro_prf.fp += 1
-                else:
-                    if k in gold_labels:
-                        micro_prf.fn += 1
+                scores.append(v)
+                is_gold.append(gold_dict.get(k) == 1.0)
+                label_ids.append(label_index.setdefault(k, len(label_index)))
+    return {
+        "labels": list(label_index),
+        "scores": numpy.asarray(scores, dtype="float64"),
+        "is_gold": numpy.asarray(is_gold, dtype="bool"),
+        "label_ids": numpy.asarray(label_ids, dtype="int64"),
+    }
+
+
+def count_relations(
+    scores: numpy.ndarray, is_gold: numpy.ndarray, thresholds: numpy.ndarray
+) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """Count true positives, false positives and false negatives for all thresholds at once:
+    a prediction is positive when its score is above or equal to the threshold."""
+    gold_scores = numpy.sort(scores[is_gold])
+    other_scores = numpy.sort(scores[~is_gold])
+    tp = len(gold_scores) - numpy.searchsorted(gold_scores, thresholds, side="left")
+    fp = len(other_scores) - numpy.searchsorted(other_scores, thresholds, side="left")
+    fn = len(gold_scores) - tp
+    return tp, fp, fn
+
+
+def prf_scores(
+    tp: numpy.ndarray, fp: numpy.ndarray, fn: numpy.ndarray
+) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """Compute precision, recall and F-score from counts (as PRFScore does)."""
+    precision = tp / (tp + fp + 1e-100)
+    recall = tp / (tp + fn + 1e-100)
+    fscore = 2 * ((precision * recall) / (precision + recall + 1e-100))
+    return precision, recall, fscore
+
+
+def score_relations(examples: Iterable[Example], threshold: float) -> Dict[str, Any]:
+    """Score a batch of examples."""
+    relations = flatten_relations(examples)
+    counts = count_relations(relations["scores"], relations["is_gold"], numpy.asarray([threshold]))
+    precision, recall, fscore = prf_scores(*counts)
+    return {
+        "rel_micro_p": float(precision[0]),
+        "rel_micro_r": float(recall[0]),
+        "rel_micro_f": float(fscore[0]),
+    }
+
+
+def score_relations_sweep(
+    examples: Iterable[Example], thresholds: List[float], max_curve_points: int = 1000
+) -> Dict[str, Any]:
+    """Score a batch of examples for several thresholds in one pass: micro scores (as
+    returned by score_relations) and scores of each label for each threshold, and the
+    precision-recall curve over the predicted scores (at most max_curve_points points)."""
+    return sweep_relations(flatten_relations(examples), thresholds, max_curve_points)
+
+
+def sweep_relations(
+    relations: Dict[str, Any], thresholds: List[float], max_curve_points: int = 1000
+) -> Dict[str, Any]:
+    """Score flattened relations (see flatten_relations) for several thresholds in one pass.
+    The points of the precision-recall curve are taken at evenly spaced ranks of the unique
+    predicted scores, from the highest to the lowest score."""
+    scores = relations["scores"]
+    is_gold = relations["is_gold"]
+    thresholds = numpy.asarray(thresholds, dtype="float64")
+    precision, recall, fscore = prf_scores(*count_relations(scores, is_gold, thresholds))
+    micro = [
+        {"rel_micro_p": p, "rel_micro_r": r, "rel_micro_f": f}
+        for p, r, f in zip(precision.tolist(), recall.tolist(), fscore.tolist())
+    ]
+    per_label = {}
+    for label_id, label in enumerate(relations["labels"]):
+        is_label = relations["label_ids"] == label_id
+        label_precision, label_recall, label_fscore = prf_scores(
+            *count_relations(scores[is_label], is_gold[is_label], thresholds)
+        )
+        per_label[label] = [
+            {"p": p, "r": r, "f": f}
+            for p, r, f in zip(label_precision.tolist(), label_recall.tolist(), label_fscore.tolist())
+        ]
+    curve_thresholds = numpy.unique(scores)[::-1]
+    if len(curve_thresholds) > max_curve_points:
+        ranks = numpy.linspace(0, len(curve_thresholds) - 1, num=max_curve_points).round().astype("int64")
+        curve_thresholds = curve_thresholds[ranks]
+    curve_precision, curve_recall, _ = prf_scores(*count_relations(scores, is_gold, curve_thresholds))
     return {
-        "rel_micro_p": micro_prf.precision,
-        "rel_micro_r": micro_prf.recall,
-        "rel_micro_f": micro_prf.fscore,
+        "thresholds": thresholds.tolist(),
+        "micro": micro,
+        "per_label": per_label,
+        "pr_curve": {
+            "thresholds": curve_thresholds.tolist(),
+            "precision": curve_precision.tolist(),
+            "recall": curve_recall.tolist(),
+        },
     }
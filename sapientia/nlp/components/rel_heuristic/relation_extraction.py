@@ -1,5 +1,33 @@
 #!/usr/bin/env python
 
+import re
+from bisect import bisect_left
+from collections import namedtuple
+
+
+class Relation(namedtuple("Relation", ["label", "source", "target"])):
+    """
+    Relation between a source and a target named entity (hashable, rendered as "label(source,target)")
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return self.label + "(" + self.source + "," + self.target + ")"
+
+
+def parse_relation(relation):
+    """
+    Parse a relation rendered as "label(source,target)"
+    :param relation: relation (string or Relation)
+    :return: relation (Relation)
+    """
+    if isinstance(relation, Relation):
+        return relation
+    label, _, named_entities = relation.partition("(")
+    named_entities = named_entities.split(",")
+    return Relation(label, named_entities[0].removesuffix(")"), named_entities[1].removesuffix(")"))
+
+
 def extract_sentences_beginning_positions(text):
     """
     Extract sentences beginning positions from a text
@@ -51,11 +79,36 @@ def get_named_entity_beginning_position(named_entity):
     return named_entity["start_char"]
 
 
-def get_sentence_for_named_entity(named_entity, text):
+def create_sentence_index(text):
+    """
+    Create an index of the sentences of a text, built once and used to find sentences by character position
+    :param text: text
+    :return: sentence index (sorted sentences start positions and sentences of the text)
+    """
+    sentences = sentence_segmentation(text)
+    return {"starts": list(sentences.keys()), "sentences": sentences}
+
+
+def get_sentence_start_for_position(position, sentence_index):
+    """
+    Get start of the sentence containing a character position (binary search)
+    :param position: character position
+    :param sentence_index: sentence index
+    :return: sentence start
+    """
+    starts = sentence_index["starts"]
+    i = bisect_left(starts, position) - 1  # last sentence starting strictly before the position
+    if i < 0:
+        return 0
+    return starts[i]
+
+
+def get_sentence_for_named_entity(named_entity, text, sentence_index=None):
     """
     Get sentence from which named entity has been extracted
     :param named_entity: named entity
     :param text: text
+    :param sentence_index: sentence index of the text (created from the text if not provided)
     :return: sentence
     """
     if not isinstance(named_entity, dict):
@@ -63,13 +116,11 @@ def get_sentence_for_named_entity(named_entity, text):
     keys = named_entity.keys()
     if "start_char" not in keys or "end_char" not in keys or "label" not in keys or "text" not in keys:
         raise TypeError(named_entity, " is not a named entity")
+    if sentence_index is None:
+        sentence_index = create_sentence_index(text)
     named_entity_beginning_position = get_named_entity_beginning_position(named_entity)
-    sentences = sentence_segmentation(text)
-    sentence_beginning = 0
-    for beginning_position in sentences.keys():
-        if named_entity_beginning_position > beginning_position > sentence_beginning:
-            sentence_beginning = beginning_position
-    return sentences[sentence_beginning]
+    sentence_beginning = get_sentence_start_for_position(named_entity_beginning_position, sentence_index)
+    return sentence_index["sentences"][sentence_beginning]
 
 
 def get_sentence_start(sentence, sentences):
@@ -130,19 +181,21 @@ def associate_sentences_to_named_entities(named_entities, text):
     """
     Associate sentence of the text to extracted named entities
     :param named_entities: named entities
-    :param sentences: sentences of the text
+    :param text: text
     :return: named entities associated to sentence of the text from which they were recognized
     """
     sentences_to_named_entities = {}
-    sentences = sentence_segmentation(text)
-    for sentence in sentences:
-        sentences_to_named_entities[sentence] = []
+    sentence_index = create_sentence_index(text)
+    for sentence_start in sentence_index["starts"]:
+        sentences_to_named_entities[sentence_start] = []
     for named_entity in named_entities:
-        sentence = get_sentence_for_named_entity(named_entity, text)
-        sentence_start = get_sentence_start(sentence, sentences)
-        elements = sentences_to_named_entities[sentence_start]
-        elements.append(named_entity)
-        sentences_to_named_entities[sentence_start] = elements
+        if not isinstance(named_entity, dict):
+            raise TypeError(named_entity, " is not a named entity")
+        keys = named_entity.keys()
+        if "start_char" not in keys or "end_char" not in keys or "label" not in keys or "text" not in keys:
+            raise TypeError(named_entity, " is not a named entity")
+        sentence_start = get_sentence_start_for_position(named_entity["start_char"], sentence_index)
+        sentences_to_named_entities[sentence_start].append(named_entity)
     return sentences_to_named_entities
 
 
@@ -167,6 +220,60 @@ def has_more_specific_occurrence_in_triggering_text(text, triggering_text, sente
     return has_more_specific_occurrence
 
 
+def triggers_trie_to_regex(trie):
+    """
+    Convert a trie of triggering texts into a regular expression matching the longest triggering text
+    :param trie: trie (dict associating characters to sub-tries, the empty key marks the end of a triggering text)
+    :return: regular expression
+    """
+    alternatives = [re.escape(character) + triggers_trie_to_regex(sub_trie)
+                    for character, sub_trie in sorted(trie.items()) if character != ""]
+    if not alternatives:
+        return ""
+    pattern = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+    if "" in trie:  # a triggering text ends here, longer ones are tried first (greedy)
+        pattern = "(?:" + pattern + ")?"
+    return pattern
+
+
+def compile_triggering_text(triggering_text):
+    """
+    Compile triggering text into a single regular expression finding, at each position of a sentence, the longest
+    (most specific) triggering text
+    :param triggering_text: possible texts triggering the relation associated with an indicator of the way to trigger
+    the relation
+    :return: compiled regular expression, None if there is no triggering text
+    """
+    trie = {}
+    for trigger in triggering_text:
+        text = trigger.get("text")
+        if not text:
+            continue
+        node = trie
+        for character in text:
+            node = node.setdefault(character, {})
+        node[""] = {}
+    if not trie:
+        return None
+    return re.compile("(?=(" + triggers_trie_to_regex(trie) + "))")  # lookahead to match at every position
+
+
+def find_triggering_text(compiled_triggering_text, sentence):
+    """
+    Find triggering text in a sentence (single pass), an occurrence of a triggering text which is part of a longer
+    (more specific) triggering text is ignored
+    :param compiled_triggering_text: triggering text compiled with compile_triggering_text
+    :param sentence: sentence
+    :return: first position of each triggering text found in the sentence
+    """
+    positions = {}
+    if compiled_triggering_text is None:
+        return positions
+    for match in compiled_triggering_text.finditer(sentence):
+        text = match.group(1)
+        if text not in positions:
+            positions[text] = match.start()
+    return positions
 
 
 def extract_relation(relation_label, sentences, sentences_to_named_entities, source_labels, target_labels, triggering_text):
@@ -190,55 +297,43 @@ def extract_relation(relation_label, sentences, sentences_to_named_entities, sou
     if triggering_text is not None and not isinstance(triggering_text, list):
         raise TypeError(triggering_text, " invalid triggering text")
     relations = []
+    found_relations = set()
+    compiled_triggering_text = compile_triggering_text(triggering_text) if triggering_text else None
     for sentence_index, named_entities in sentences_to_named_entities.items():
         source_named_entities = []
         target_named_entities = []
         if source_labels or target_labels:
             for named_entity in named_entities:
-                if source_labels:
-                    for source_label in source_labels:
-                        if named_entity["label"] == source_label:
-                            source_named_entities.append(named_entity)
-                if target_labels:
-                    for target_label in target_labels:
-                        if named_entity["label"] == target_label:
-                            target_named_entities.append(named_entity)
+                if source_labels and named_entity["label"] in source_labels:
+                    source_named_entities.append(named_entity)
+                if target_labels and named_entity["label"] in target_labels:
+                    target_named_entities.append(named_entity)
         else:
             for named_entity in named_entities:
                 source_named_entities.append(named_entity)
                 target_named_entities.append(named_entity)
+        if not source_named_entities or not target_named_entities:
+            continue
         if triggering_text:
             sentence = sentences[sentence_index]
-            has_triggering_text = False
+            triggers_positions = find_triggering_text(compiled_triggering_text, sentence)
             for trigger in triggering_text:
-                text = trigger.get("text")
-                if text in sentence:
-                    has_triggering_text = True
-            if has_triggering_text:
-                text_index = 0
-                for trigger in triggering_text:
-                    text = trigger.get("text")
-                    active = trigger.get("active")
-                    if text in sentence:
-                        text_index = get_sentence_start(sentence_index, sentences) + sentence.find(text)
-                        has_more_specific_occurrence = has_more_specific_occurrence_in_triggering_text(text, triggering_text, sentence)
-                        if not has_more_specific_occurrence:
-                            if active:
-                                for source_named_entity in source_named_entities:
-                                    for target_name_entity in target_named_entities:
-                                        if source_named_entity["start_char"] < text_index < target_name_entity["start_char"]:
-                                            if source_named_entity != target_name_entity:
-                                                relation = relation_label + "(" + source_named_entity["text"].lower() + "," + target_name_entity["text"].lower() + ")"
-                                                if relation not in relations:
-                                                    relations.append(relation)
-                            else:
-                                for source_named_entity in source_named_entities:
-                                    for target_name_entity in target_named_entities:
-                                        if target_name_entity["start_char"] < text_index < source_named_entity["start_char"]:
-                                            if source_named_entity != target_name_entity:
-                                                relation = relation_label + "(" + source_named_entity["text"].lower() + "," + target_name_entity["text"].lower() + ")"
-                                                if relation not in relations:
-                                                    relations.append(relation)
+                position = triggers_positions.get(trigger.get("text"))
+                if position is None:
+                    continue
+                active = trigger.get("active")
+                text_index = sentence_index + position  # sentences are indexed by their start character
+                for source_named_entity in source_named_entities:
+                    for target_name_entity in target_named_entities:
+                        if active:
+                            triggered = source_named_entity["start_char"] < text_index < target_name_entity["start_char"]
+                        else:
+                            triggered = target_name_entity["start_char"] < text_index < source_named_entity["start_char"]
+                        if triggered and source_named_entity != target_name_entity:
+                            relation = Relation(relation_label, source_named_entity["text"].lower(), target_name_entity["text"].lower())
+                            if relation not in found_relations:
+                                found_relations.add(relation)
+                                relations.append(str(relation))
         else:
             for target_name_entity in target_named_entities:
                 source_entity = None
@@ -250,43 +345,44 @@ def extract_relation(relation_label, sentences, sentences_to_named_entities, sou
                         else:
                             source_entity = source_named_entity
                 if source_entity is not None and source_entity != target_name_entity:
-                    relation = relation_label + "(" + source_entity["text"].lower() + "," + target_name_entity["text"].lower() + ")"
-                    if relation not in relations:
-                        relations.append(relation)
+                    relation = Relation(relation_label, source_entity["text"].lower(), target_name_entity["text"].lower())
+                    if relation not in found_relations:
+                        found_relations.add(relation)
+                        relations.append(str(relation))
     return relations
 
 
 def create_new_relations_from_existing_relations(relations, first_relation_label, first_named_entity_position, second_relation_label, second_named_entity_position, new_relation_label):
     """
     Create relations from existing relations with transitivity property
-    :param relations: relations
+    :param relations: relations (strings rendered as "label(source,target)" or Relation)
     :param first_relation_label: first relation label used to create new relations
     :param first_named_entity_position: named entity position to use in the first relation in order to create the new relation (can be "left" or "right")
     :param second_relation_label: second relation label used to create new relations
     :param second_named_entity_position: named entity position to use in the second relation in order to create the new relation (can be "left" or "right")
     :param new_relation_label: new relation label
+    :return: new relations (rendered as "label(source,target)")
     """
+    relations = [parse_relation(relation) for relation in relations]
+    # index the named entities of the second relations by the named entity they share with the first relations
+    second_named_entities = {}
+    for relation in relations:
+        if relation.label == second_relation_label:
+            common_entity = relation.source if second_named_entity_position == "right" else relation.target
+            second_entity = relation.source if second_named_entity_position == "left" else relation.target
+            second_named_entities.setdefault(common_entity, []).append(second_entity)
     new_relations = []
+    found_relations = set()
     for relation in relations:
-        if relation.split("(")[0] == first_relation_label:
-            left_entity = relation.split("(")[1].split(",")[0].removesuffix(")")
-            right_entity = relation.split("(")[1].split(",")[1].removesuffix(")")
-            first_entity = left_entity
-            common_entity = right_entity
+        if relation.label == first_relation_label:
+            first_entity = relation.source
+            common_entity = relation.target
             if first_named_entity_position == "right":
-                first_entity = right_entity
-                common_entity = left_entity
-            for rel in relations:
-                if rel.split("(")[0] == second_relation_label:
-                    possible_common_entity = rel.split("(")[1].split(",")[1].removesuffix(")")
-                    if second_named_entity_position == "right":
-                        possible_common_entity = rel.split("(")[1].split(",")[0].removesuffix(")")
-                    if possible_common_entity == common_entity:
-                        if second_named_entity_position == "left":
-                            second_entity = rel.split("(")[1].split(",")[0].removesuffix(")")
-                        else:
-                            second_entity = rel.split("(")[1].split(",")[1].removesuffix(")")
-                        new_relation = new_relation_label + "(" + first_entity + "," + second_entity + ")"
-                        if new_relation not in new_relations:
-                            new_relations.append(new_relation)
+                first_entity = relation.target
+                common_entity = relation.source
+            for second_entity in second_named_entities.get(common_entity, []):
+                new_relation = Relation(new_relation_label, first_entity, second_entity)
+                if new_relation not in found_relations:
+                    found_relations.add(new_relation)
+                    new_relations.append(str(new_relation))
     return new_relations
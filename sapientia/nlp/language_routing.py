@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+from itertools import islice
+
+from langdetect.lang_detect_exception import LangDetectException
+
+from sapientia.language_detection.language_detection import detect_language_sampled, detect_language_segments
+from sapientia.nlp.nlp import model_registry, apply_model_batch, named_entity_recognition
+
+default_models = {"en": "en_core_web_sm", "fr": "fr_core_news_sm"}  # NLP models (SpaCy) by language
+
+
+class LanguageRouter:
+    """
+    Route texts to the NLP model of their language: the language of each text is detected, texts are grouped by
+    language and each group is processed by batches through the corresponding model
+    """
+
+    def __init__(self, models=None, fallback_model="en_core_web_sm", batch_size=64, n_process=1, buffer_size=1000,
+                 registry=model_registry):
+        """
+        Create a language router
+        :param models: NLP models (SpaCy) by language (ISO 639-1 code)
+        :param fallback_model: NLP model used for texts in other languages, or whose language can't be detected
+        :param batch_size: number of texts processed in each batch
+        :param n_process: number of processes used to process texts
+        :param buffer_size: number of texts grouped by language at once
+        :param registry: model registry from which the models are loaded
+        """
+        self.models = dict(default_models if models is None else models)
+        self.fallback_model = fallback_model
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.buffer_size = buffer_size
+        self.registry = registry
+
+    def detect_language(self, text):
+        """
+        Detect main language used in a text
+        :param text: text
+        :return: main language used in the text, None if it can't be detected
+        """
+        try:
+            return detect_language_sampled(text)[0]  # sampled, so that long documents are routed quickly
+        except LangDetectException:  # no feature in the text (empty text, numbers...)
+            return None
+
+    def get_model_name(self, language):
+        """
+        Get the NLP model used for a language
+        :param language: language
+        :return: NLP model (SpaCy)
+        """
+        return self.models.get(language, self.fallback_model)
+
+    def apply_models(self, texts, languages):
+        """
+        Apply the NLP model of their language on texts, texts in the same language being processed by batches
+        :param texts: texts
+        :param languages: language of each text
+        :return: texts processed with NLP workflow, in the order of the input texts
+        """
+        groups = {}  # indices of the texts by NLP model
+        for i, language in enumerate(languages):
+            groups.setdefault(self.get_model_name(language), []).append(i)
+        docs = [None] * len(texts)
+        for model, indices in groups.items():
+            nlp = self.registry.get(model)
+            group_docs = apply_model_batch(nlp, (texts[i] for i in indices), batch_size=self.batch_size,
+                                           n_process=self.n_process)
+            for i, doc in zip(indices, group_docs):
+                docs[i] = doc
+        return docs
+
+    def pipe(self, texts):
+        """
+        Apply the NLP model of their language on texts
+        :param texts: texts (any iterable, consumed lazily)
+        :return: generator of (language, text processed with NLP workflow) tuples, in the order of the input texts
+        """
+        texts = iter(texts)
+        while True:
+            buffer = list(islice(texts, self.buffer_size))
+            if not buffer:
+                return
+            languages = [self.detect_language(text) for text in buffer]
+            yield from zip(languages, self.apply_models(buffer, languages))
+
+    def pipe_segments(self, text, min_segment_size=200):
+        """
+        Apply the NLP model of their language on the segments of a text mixing several languages
+        :param text: text
+        :param min_segment_size: minimum number of characters of a segment
+        :return: list of (start character, end character, language, segment processed with NLP workflow) tuples
+        """
+        spans = detect_language_segments(text, min_segment_size=min_segment_size)
+        docs = self.apply_models([text[start:end] for start, end, language in spans],
+                                 [language for start, end, language in spans])
+        return [(start, end, language, doc) for (start, end, language), doc in zip(spans, docs)]
+
+    def named_entity_recognition(self, text, min_segment_size=200):
+        """
+        Named entity recognition on a text mixing several languages, each segment being processed by the NLP model of
+        its language
+        :param text: text
+        :param min_segment_size: minimum number of characters of a segment
+        :return: named entities (with character offsets in the text) and the language of their segment
+        """
+        named_entities = []
+        for start, end, language, doc in self.pipe_segments(text, min_segment_size=min_segment_size):
+            for named_entity in named_entity_recognition(doc):
+                named_entity["start_char"] += start  # offsets in the segment are moved to offsets in the text
+                named_entity["end_char"] += start
+                named_entity["language"] = language
+                named_entities.append(named_entity)
+        return named_entities
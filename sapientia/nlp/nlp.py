@@ -1,18 +1,102 @@
 #!/usr/bin/env python
 
+import threading
+from collections import OrderedDict
+
 import spacy
 
 
-def load_model(model):
+def load_model(model, disable=None, exclude=None):
     """
     Load Natural Language Processing (NLP) model
     :param model: NLP model (SpaCy)
+    :param disable: names of the pipeline components to load disabled
+    :param exclude: names of the pipeline components not to load
     :return: Language object containing all components and data needed to process text
     """
-    nlp = spacy.load(model)
+    nlp = spacy.load(model, disable=list(disable or []), exclude=list(exclude or []))
     return nlp
 
 
+class ModelRegistry:
+    """
+    Registry of NLP models, loaded lazily on first use and shared across threads, keeping at most a given number of
+    models in memory (the least recently used model is released first)
+    """
+
+    def __init__(self, max_models=4):
+        """
+        Create a model registry
+        :param max_models: maximum number of models kept in memory
+        """
+        if max_models < 1:
+            raise ValueError(max_models, " invalid maximum number of models")
+        self.max_models = max_models
+        self.models = OrderedDict()  # models by key, from the least to the most recently used
+        self.loading = {}  # locks of the models being loaded, by key
+        self.lock = threading.Lock()
+
+    def get_cached(self, key):
+        """
+        Get a model already in memory (the registry lock must be held)
+        :param key: model key
+        :return: Language object, None if the model is not in memory
+        """
+        nlp = self.models.get(key)
+        if nlp is not None:
+            self.models.move_to_end(key)
+        return nlp
+
+    def get(self, model, disable=None, exclude=None):
+        """
+        Get a NLP model, loading it if it is not already in memory
+        :param model: NLP model (SpaCy)
+        :param disable: names of the pipeline components to load disabled
+        :param exclude: names of the pipeline components not to load
+        :return: Language object containing all components and data needed to process text
+        """
+        key = (str(model), tuple(sorted(disable or [])), tuple(sorted(exclude or [])))
+        with self.lock:
+            nlp = self.get_cached(key)
+            if nlp is not None:
+                return nlp
+            key_lock = self.loading.setdefault(key, threading.Lock())
+        with key_lock:  # a model is loaded only once, even if it is requested by several threads
+            with self.lock:
+                nlp = self.get_cached(key)
+                if nlp is not None:
+                    return nlp
+            nlp = load_model(model, disable=disable, exclude=exclude)
+            with self.lock:
+                self.models[key] = nlp
+                self.loading.pop(key, None)
+                while len(self.models) > self.max_models:
+                    self.models.popitem(last=False)
+        return nlp
+
+    def clear(self):
+        """
+        Release all the models in memory
+        :return: None
+        """
+        with self.lock:
+            self.models.clear()
+
+
+model_registry = ModelRegistry()  # process-wide model registry
+
+
+def get_model(model, disable=None, exclude=None):
+    """
+    Get a NLP model from the process-wide model registry, loading it on first use
+    :param model: NLP model (SpaCy)
+    :param disable: names of the pipeline components to load disabled
+    :param exclude: names of the pipeline components not to load
+    :return: Language object containing all components and data needed to process text
+    """
+    return model_registry.get(model, disable=disable, exclude=exclude)
+
+
 def apply_model(nlp, text):
     """
     Apply NLP model on a text
@@ -24,6 +108,18 @@ def apply_model(nlp, text):
     return doc
 
 
+def apply_model_batch(nlp, texts, batch_size=64, n_process=1):
+    """
+    Apply NLP model on texts by batches
+    :param nlp: NLP chain (Language object containing all components and data needed to process text)
+    :param texts: texts (any iterable, consumed lazily)
+    :param batch_size: number of texts processed in each batch
+    :param n_process: number of processes used to process texts (-1 to use all the CPUs)
+    :return: generator of texts processed with NLP workflow (SpaCy), in the order of the input texts
+    """
+    yield from nlp.pipe(texts, batch_size=batch_size, n_process=n_process)
+
+
 def tokenize(doc):
     """
     Tokenization
@@ -44,6 +140,16 @@ def tokenize(doc):
     return tokens
 
 
+def tokenize_batch(docs):
+    """
+    Tokenization of several texts
+    :param docs: texts processed through NLP model (SpaCy)
+    :return: generator of tokens of each text
+    """
+    for doc in docs:
+        yield tokenize(doc)
+
+
 def sentence_segmentation(doc):
     """
     Sentence segmentation
@@ -76,6 +182,16 @@ def named_entity_recognition(doc):
     return named_entities
 
 
+def named_entity_recognition_batch(docs):
+    """
+    Named entity recognition on several texts
+    :param docs: texts processed through NLP model (SpaCy)
+    :return: generator of named entities of each text
+    """
+    for doc in docs:
+        yield named_entity_recognition(doc)
+
+
 def get_vocab(nlp):
     """
     Get lexemes in vocabulary
@@ -119,3 +235,60 @@ def relations_to_triples(relations, doc):
         triples.append(str(max(labels_list, key=lambda key: labels_list[key])) + "(" + str(doc[rel[0]]) + "," +
                        str(doc[rel[1]]) + ")")
     return triples
+
+
+def relation_scores_to_triples(relation_scores, doc, threshold=None):
+    """
+    Export relations to triples from the compact scores of the relation extraction component (doc._.rel_scores)
+    :param relation_scores: labels, entity pairs and scores of each pair for each label
+    :param doc: text processed through NLP model (SpaCy)
+    :param threshold: minimum score of the best label of a pair (all pairs are exported if None)
+    :return: triples
+    """
+    scores = relation_scores["scores"]
+    if len(scores) == 0:
+        return []
+    best = scores.argmax(axis=1)
+    pairs = relation_scores["pairs"]
+    if threshold is not None:
+        kept = scores[range(len(scores)), best] >= threshold
+        best, pairs = best[kept], pairs[kept]
+    labels = relation_scores["labels"]
+    return [labels[label] + "(" + str(doc[int(source)]) + "," + str(doc[int(target)]) + ")"
+            for label, (source, target) in zip(best.tolist(), pairs.tolist())]
+
+
+def get_relation_triples(doc):
+    """
+    Export relations of a text to triples
+    :param doc: text processed through NLP model (SpaCy)
+    :return: triples (relations of doc._.rel, only those above the threshold of the component when it is sparse)
+    """
+    if doc.has_extension("rel"):
+        return relations_to_triples(doc._.rel, doc)
+    return []
+
+
+def relations_to_triples_batch(docs):
+    """
+    Export relations of several texts to triples
+    :param docs: texts processed through NLP model (SpaCy) with a relation extraction component
+    :return: generator of triples of each text
+    """
+    for doc in docs:
+        yield get_relation_triples(doc)
+
+
+def extract_knowledge_batch(nlp, texts, batch_size=64, n_process=1):
+    """
+    Extract named entities and relations from texts by batches
+    :param nlp: NLP chain (Language object containing all components and data needed to process text)
+    :param texts: texts (any iterable, consumed lazily)
+    :param batch_size: number of texts processed in each batch
+    :param n_process: number of processes used to process texts (-1 to use all the CPUs)
+    :return: generator of named entities and relations (triples) of each text, in the order of the input texts
+    """
+    for doc in apply_model_batch(nlp, texts, batch_size=batch_size, n_process=n_process):
+        named_entities = named_entity_recognition(doc)
+        relations = get_relation_triples(doc)
+        yield {"named_entities": named_entities, "relations": relations}
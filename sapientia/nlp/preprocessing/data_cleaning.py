@@ -1,6 +1,43 @@
 #!/usr/bin/env python
 
+import json
+import os
 import re
+import time
+
+default_cleaning_rules_file = os.path.join(os.path.dirname(__file__), "cleaning_rules.json")
+default_cleaning_rules = None  # loaded on first use
+
+
+def is_broken_sentence(sentence):
+    """
+    Check if a sentence has been wrongly split (for example, e.g. might be considered as the end of a sentence)
+    :param sentence: sentence
+    :return: true if the sentence continues in the next one, false otherwise
+    """
+    return sentence.endswith("e.g") or sentence.endswith("(e.g") or sentence.endswith("ref") or \
+        sentence.endswith("(ref")
+
+
+def iter_sentences_fixing(sentences):
+    """
+    Sentences fixing (streaming stage)
+    :param sentences: sentences extracted from text (any iterable, consumed lazily)
+    :return: generator of correct sentences (when sentences are split, there might be errors that need fixing. For
+    example, e.g. might be considered as the end of a sentence, and it should not.)
+    """
+    pending = None  # last sentence, which might continue in the next one
+    broken = False
+    for sentence in sentences:
+        if broken and pending is not None:
+            pending = pending + ". " + sentence
+        else:
+            if pending is not None:
+                yield pending
+            pending = sentence
+        broken = is_broken_sentence(sentence)
+    if pending is not None:
+        yield pending
 
 
 def sentences_fixing(sentences):
@@ -10,28 +47,26 @@ def sentences_fixing(sentences):
     :return: correct sentences (when sentences are split, there might be errors that need fixing. For example,
     e.g. might be considered as the end of a sentence, and it should not.)
     """
-    fixed_sentences = []
-    eg = "e.g"
-    eg_parenthesis = "(e.g"
-    ref = "ref"
-    ref_parenthesis = "(ref"
-    broken = False
+    return list(iter_sentences_fixing(sentences))
+
+
+def iter_group_lists_in_sentences(sentences):
+    """
+    Group items from lists as single sentence (streaming stage)
+    :param sentences: sentences (any iterable, consumed lazily)
+    :return: generator of sentences with grouped items from lists
+    """
+    pending = None  # last sentence, to which the next list items are added
     for sentence in sentences:
-        if broken:
-            if fixed_sentences:
-                new_sentence = fixed_sentences.pop() + ". " + sentence
-            else:
-                new_sentence = sentences[0]
-            fixed_sentences.append(new_sentence)
+        bullet = sentence.startswith("•") or sentence.startswith("-")
+        if bullet and pending is not None:
+            pending = pending + " " + sentence
         else:
-            fixed_sentences.append(sentence)
-        if sentence.endswith(eg) or sentence.endswith(eg_parenthesis) or sentence.endswith(ref) or \
-                sentence.endswith(ref_parenthesis):
-            broken = True
-        else:
-            if broken:
-                broken = False
-    return fixed_sentences
+            if pending is not None:
+                yield pending
+            pending = sentence
+    if pending is not None:
+        yield pending
 
 
 def group_lists_in_sentences(sentences):
@@ -40,42 +75,183 @@ def group_lists_in_sentences(sentences):
     :param sentences: sentences
     :return: sentences with grouped items from lists
     """
-    grouped_sentences = []
-    for sentence in sentences:
-        if sentence.startswith("•") or sentence.startswith("-"):
-            bullet = True
-        else:
-            bullet = False
-        if bullet:
-            if grouped_sentences:
-                new_sentence = grouped_sentences.pop() + " " + sentence
-                grouped_sentences.append(new_sentence)
+    return list(iter_group_lists_in_sentences(sentences))
+
+
+class CleaningRules:
+    """
+    Sentences cleaning rules engine: rules are compiled once, consecutive substitution rules are merged into a single
+    regular expression pass, and hits and time spent are recorded for each rule
+    Rule actions are "remove" (remove matches), "replace" (replace matches by the rule replacement) and "truncate"
+    (remove everything from the first match). Patterns are literal texts unless the rule is a regular expression.
+    Merged rules are applied simultaneously: a rule that must see the text left by previous rules (for example, a
+    header wrapped on several lines, once line breaks are removed) must not be merged ("merge": false).
+    """
+
+    def __init__(self, rules, drop=None, strip_leading_whitespace=True):
+        """
+        Create a cleaning rules engine
+        :param rules: cleaning rules (dicts with name, action, pattern, and optionally regex, replacement and merge)
+        :param drop: sentences dropped before cleaning (for example, empty fragments)
+        :param strip_leading_whitespace: remove whitespace at the beginning of cleaned sentences
+        """
+        self.drop = set(drop or [])
+        self.strip_leading_whitespace = strip_leading_whitespace
+        self.hits = {}
+        self.passes = []  # compiled passes (names of their rules, pattern, replacement function or None to truncate)
+        self.timings = []  # time spent in each pass
+        merged = []  # consecutive substitution rules merged into the next pass
+        for rule in rules:
+            if rule.get("action") not in ("remove", "replace", "truncate"):
+                raise ValueError(rule, " invalid cleaning rule")
+            self.hits[rule["name"]] = 0
+            if rule["action"] == "truncate" or not rule.get("merge", True):
+                self.add_substitution_pass(merged)
+                merged = []
+            if rule["action"] == "truncate":
+                self.passes.append(([rule["name"]], self.compile_pattern(rule), None))
             else:
-                grouped_sentences.append(sentence)
-        else:
-            grouped_sentences.append(sentence)
-    return grouped_sentences
+                merged.append(rule)
+                if not rule.get("merge", True):
+                    self.add_substitution_pass(merged)
+                    merged = []
+        self.add_substitution_pass(merged)
+        self.timings = [0.0] * len(self.passes)
+
+    @staticmethod
+    def compile_pattern(rule):
+        """
+        Get the regular expression of a rule
+        :param rule: cleaning rule
+        :return: compiled regular expression
+        """
+        return re.compile(rule["pattern"] if rule.get("regex", False) else re.escape(rule["pattern"]))
 
+    def add_substitution_pass(self, rules):
+        """
+        Add a single pass applying substitution rules (one named group per rule in a combined regular expression)
+        :param rules: substitution rules
+        :return: None
+        """
+        if not rules:
+            return
+        groups = ["(?P<rule" + str(i) + ">" + self.compile_pattern(rule).pattern + ")" for i, rule in enumerate(rules)]
+        names = [rule["name"] for rule in rules]
+        replacements = [rule.get("replacement", "") if rule["action"] == "replace" else "" for rule in rules]
+        hits = self.hits
 
-def sentences_cleaning(sentences):
+        def replace(match):
+            i = int(match.lastgroup[4:])
+            hits[names[i]] += 1
+            return replacements[i]
+
+        self.passes.append((names, re.compile("|".join(groups)), replace))
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Load cleaning rules from a configuration file (JSON)
+        :param path: configuration file path
+        :return: cleaning rules engine
+        """
+        with open(path, "r", encoding="utf8") as file:
+            configuration = json.load(file)
+        return cls(configuration["rules"], drop=configuration.get("drop"),
+                   strip_leading_whitespace=configuration.get("strip_leading_whitespace", True))
+
+    def clean(self, sentence):
+        """
+        Sentence cleaning
+        :param sentence: sentence extracted from text
+        :return: cleaned sentence
+        """
+        for i, (names, pattern, replace) in enumerate(self.passes):
+            start = time.perf_counter()
+            if replace is not None:
+                sentence = pattern.sub(replace, sentence)
+            else:
+                match = pattern.search(sentence)
+                if match is not None:
+                    self.hits[names[0]] += 1
+                    sentence = sentence[:match.start()]
+            self.timings[i] += time.perf_counter() - start
+        if self.strip_leading_whitespace:
+            sentence = sentence.lstrip()
+        return sentence
+
+    def statistics(self):
+        """
+        Get cleaning statistics
+        :return: hits of each rule, and time spent in each pass with the names of its rules
+        """
+        return {
+            "hits": dict(self.hits),
+            "passes": [{"rules": names, "seconds": seconds} for (names, _, _), seconds in zip(self.passes, self.timings)]
+        }
+
+
+def get_default_cleaning_rules():
+    """
+    Get default cleaning rules (loaded from the default configuration file on first use)
+    :return: cleaning rules engine
+    """
+    global default_cleaning_rules
+    if default_cleaning_rules is None:
+        default_cleaning_rules = CleaningRules.from_file(default_cleaning_rules_file)
+    return default_cleaning_rules
+
+
+def sentence_cleaning(sentence, rules=None):
+    """
+    Sentence cleaning
+    :param sentence: sentence extracted from text
+    :param rules: cleaning rules engine (default cleaning rules if not provided)
+    :return: cleaned sentence
+    """
+    if rules is None:
+        rules = get_default_cleaning_rules()
+    return rules.clean(sentence)
+
+
+def iter_sentences_cleaning(sentences, rules=None):
+    """
+    Sentences cleaning (streaming stage)
+    :param sentences: sentences extracted from text (any iterable, consumed lazily)
+    :param rules: cleaning rules engine (default cleaning rules if not provided)
+    :return: generator of cleaned sentences
+    """
+    if rules is None:
+        rules = get_default_cleaning_rules()
+    drop = rules.drop
+    clean = rules.clean
+    for sentence in sentences:
+        if sentence in drop:  # empty fragments are dropped
+            continue
+        yield clean(sentence)
+
+
+def sentences_cleaning(sentences, rules=None):
     """
     Sentences cleaning
     :param sentences: sentences extracted from text
+    :param rules: cleaning rules engine (default cleaning rules if not provided)
     :return: cleaned sentences
     """
-    while "" in sentences:
-        sentences.remove("")
-    while ", " in sentences:
-        sentences.remove(", ")
-    while "," in sentences:
-        sentences.remove(",")
-    cleaned_sentences = []
-    for sentence in sentences:
-        sent = sentence.replace("\n", "")
-        sent = sent.replace("\"", "")
-        sent = re.sub("Page [0-9]+ of [0-9]+", "", sent)
-        sent = re.sub("CONFIDENTIAL AND PROPRIETARY DOCUMENT", "", sent)
-        sent = sent.partition("CORAC GENOME - SPOILER ROTARY EMA SPECIFICATION")[0]
-        sent = sent.lstrip()
-        cleaned_sentences.append(sent)
-    return cleaned_sentences
+    return list(iter_sentences_cleaning(sentences, rules))
+
+
+default_preprocessing_stages = [iter_sentences_cleaning, iter_sentences_fixing, iter_group_lists_in_sentences]
+
+
+def preprocessing_pipeline(sentences, stages=None):
+    """
+    Chain streaming preprocessing stages, sentences are processed lazily without building intermediate lists
+    :param sentences: sentences extracted from text (any iterable)
+    :param stages: streaming stages (functions taking and returning iterables of sentences), cleaning, fixing and
+    grouping of lists by default
+    :return: generator of preprocessed sentences
+    """
+    sentences = iter(sentences)
+    for stage in default_preprocessing_stages if stages is None else stages:
+        sentences = stage(sentences)
+    return sentences
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+non_breaking_words = {"e.g", "i.e", "ref"}  # words after which a period never ends a sentence
+
+
+def get_word_before(text, position, start):
+    """
+    Get the word ending at a position of a text
+    :param text: text
+    :param position: end position of the word
+    :param start: position before which the word can't start
+    :return: word (without opening parenthesis)
+    """
+    word_start = max(text.rfind(" ", start, position), text.rfind("\n", start, position)) + 1
+    return text[max(word_start, start):position].lstrip("(")
+
+
+def is_sentence_end(text, position, start, abbreviations):
+    """
+    Check if a period followed by a space ends a sentence
+    :param text: text
+    :param position: period position
+    :param start: sentence start
+    :param abbreviations: abbreviations (any container, for example the abbreviations from get_abbreviations)
+    :return: true if the period ends the sentence, false otherwise
+    """
+    word = get_word_before(text, position, start)
+    if word in non_breaking_words:
+        return False
+    if abbreviations and word in abbreviations:
+        # an abbreviation can also end a sentence: the period is kept in the sentence if the next word is lower case
+        next_character = text[position + 2:position + 3]
+        return not next_character.islower()
+    return True
+
+
+def sentence_spans(text, abbreviations=None):
+    """
+    Rule-based sentence segmentation preserving offsets: sentences end with a period followed by a space, except after
+    e.g., i.e., ref. and abbreviations followed by a lower case word
+    :param text: text
+    :param abbreviations: abbreviations (any container, for example the abbreviations from get_abbreviations)
+    :return: generator of (start, end) character offsets of the sentences in the text (sentences don't include
+    leading whitespace)
+    """
+    length = len(text)
+    start = 0
+    position = text.find(". ")
+    while position != -1:
+        if is_sentence_end(text, position, start, abbreviations):
+            while start < position and text[start].isspace():
+                start += 1
+            yield start, position + 1  # the period is part of the sentence
+            start = position + 2
+        position = text.find(". ", position + 2)
+    while start < length and text[start].isspace():
+        start += 1
+    if start < length:
+        yield start, length
+
+
+def iter_sentences(text, abbreviations=None):
+    """
+    Rule-based sentence segmentation
+    :param text: text
+    :param abbreviations: abbreviations (any container, for example the abbreviations from get_abbreviations)
+    :return: generator of sentences
+    """
+    for start, end in sentence_spans(text, abbreviations):
+        yield text[start:end]
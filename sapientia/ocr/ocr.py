@@ -1,13 +1,20 @@
 #!/usr/bin/env python
 
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import quote
+
+import requests
 import tika
+from requests.adapters import HTTPAdapter
 from tika import parser
+from urllib3.util.retry import Retry
 
 tika.TikaClientOnly = True  # server mode (Apache Tika)
 tika_server = 'http://localhost:9998/'  # server address (Apache Tika)
 
 
-def parse(file):
+def parse_file(file):
     """
     Parse a file and extract its textual content (Apache Tika)
     :param file: file path
@@ -15,3 +22,106 @@ def parse(file):
     """
     parsed = parser.from_file(file)
     return parsed["content"]
+
+
+def parse(file, cache=None):
+    """
+    Parse a file and extract its textual content (Apache Tika)
+    :param file: file path
+    :param cache: parse cache (ParseCache) used to avoid parsing the same content twice
+    :return: parsed content of the file
+    """
+    if cache is None:
+        return parse_file(file)
+    return cache.get_or_parse(file, parse_file, settings={"server": tika_server, "service": "all"})
+
+
+class TikaClient:
+    """
+    Apache Tika client sending files through a pool of keep-alive connections, with timeouts, retries and a bounded
+    number of requests in flight
+    """
+
+    def __init__(self, server=tika_server, max_in_flight=8, timeout=60, retries=3, backoff_factor=0.5):
+        """
+        Create a Tika client
+        :param server: server address (Apache Tika)
+        :param max_in_flight: maximum number of concurrent requests (and of pooled connections)
+        :param timeout: timeout (in seconds) of a request, can be a (connect, read) tuple
+        :param retries: number of retries on connection errors and server errors
+        :param backoff_factor: backoff factor between retries (in seconds)
+        """
+        if max_in_flight < 1:
+            raise ValueError(max_in_flight, " invalid maximum number of requests in flight")
+        self.server = server.rstrip("/") + "/"
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=(500, 502, 503, 504),
+                      allowed_methods=None)  # PUT requests are not retried by default
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def parse(self, file):
+        """
+        Parse a file and extract its textual content
+        :param file: file path
+        :return: parsed content of the file
+        """
+        with open(file, "rb") as f:
+            data = f.read()  # the body is kept in memory so that it can be sent again on retries
+        headers = {
+            "Accept": "text/plain",
+            "Content-Disposition": "attachment; filename=" + quote(os.path.basename(file))  # helps type detection
+        }
+        response = self.session.put(self.server + "tika", data=data, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        response.encoding = "utf-8"
+        return response.text
+
+    def parse_many(self, files):
+        """
+        Parse files concurrently
+        :param files: file paths
+        :return: generator of (file path, parsed content) tuples, yielded as soon as files are parsed
+        """
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            in_flight = {}
+            for file in files:
+                if len(in_flight) >= self.max_in_flight:  # wait for a request to complete before sending a new one
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield in_flight.pop(future), future.result()
+                in_flight[executor.submit(self.parse, file)] = file
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield in_flight.pop(future), future.result()
+
+    def close(self):
+        """
+        Close the pooled connections
+        :return: None
+        """
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def parse_many(files, server=tika_server, max_in_flight=8, timeout=60, retries=3):
+    """
+    Parse files concurrently and extract their textual content (Apache Tika)
+    :param files: file paths
+    :param server: server address (Apache Tika)
+    :param max_in_flight: maximum number of concurrent requests
+    :param timeout: timeout (in seconds) of a request
+    :param retries: number of retries on connection errors and server errors
+    :return: generator of (file path, parsed content) tuples, yielded as soon as files are parsed
+    """
+    with TikaClient(server, max_in_flight=max_in_flight, timeout=timeout, retries=retries) as client:
+        yield from client.parse_many(files)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from sapientia.io.io import file_digest
+
+# fraction of the maximum size kept when entries are evicted, so that a full cache isn't scanned again on every put
+eviction_watermark = 0.9
+
+
+def touch(path):
+    """
+    Set the modification time of a file to the current time (with the precision of the clock, file system timestamps
+    might be coarser)
+    :param path: file path
+    :return: None
+    """
+    now = time.time_ns()
+    os.utime(path, ns=(now, now))
+
+
+class ParseCache:
+    """
+    Content-addressed on-disk cache of parsed files, keyed by the SHA-256 digest of the file content and of the parser
+    settings, with a least recently used (LRU) eviction policy bounding its size
+    The cache directory is the only shared state: several processes (for example, the workers of
+    create_training_data, each with its own copy of the cache) can use the same cache and the last access of an entry
+    is its modification time. The size of the cache is tracked incrementally by each process, the directory is only
+    scanned again when this size goes over the maximum size or every scan_interval puts, so that processes converge
+    to the size on disk.
+    """
+
+    def __init__(self, directory, max_size=1 << 30, compress=False, scan_interval=1000):
+        """
+        Create a parse cache
+        :param directory: cache directory (created if it doesn't already exist)
+        :param max_size: maximum size (in bytes) of the cached content
+        :param compress: store parsed content compressed (gzip)
+        :param scan_interval: maximum number of puts between two scans of the cache directory
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.compress = compress
+        self.scan_interval = scan_interval
+        self.size = None  # size of the cached content (None until the cache directory is scanned)
+        self.puts = 0  # puts since the last scan
+        self.hits = 0  # hits and misses of this process
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def get_key(self, file, settings=None):
+        """
+        Get the cache key of a file
+        :param file: file path
+        :param settings: parser settings (JSON serializable)
+        :return: cache key
+        """
+        key = hashlib.sha256(file_digest(file).encode("utf-8"))
+        key.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+        return key.hexdigest()
+
+    def get_path(self, key, compressed):
+        """
+        Get the path of a cache entry
+        :param key: cache key
+        :param compressed: whether the entry is compressed
+        :return: entry path
+        """
+        return os.path.join(self.directory, key[:2], key + (".txt.gz" if compressed else ".txt"))
+
+    def scan_entries(self):
+        """
+        Scan the entries stored in the cache directory
+        :return: entries (last access, path and size), from the least to the most recently used
+        """
+        entries = []
+        for path, directories, files in os.walk(self.directory):
+            for file in files:
+                if file.endswith(".txt") or file.endswith(".txt.gz"):
+                    entry_path = os.path.join(path, file)
+                    try:
+                        stat = os.stat(entry_path)
+                    except FileNotFoundError:  # evicted by another process
+                        continue
+                    entries.append((stat.st_mtime_ns, entry_path, stat.st_size))
+        entries.sort()
+        return entries
+
+    def get(self, key):
+        """
+        Get parsed content from the cache
+        :param key: cache key
+        :return: parsed content, None if it is not in the cache
+        """
+        for compressed in (self.compress, not self.compress):
+            entry_path = self.get_path(key, compressed)
+            try:
+                if compressed:
+                    with gzip.open(entry_path, "rt", encoding="utf-8") as file:
+                        content = file.read()
+                else:
+                    with open(entry_path, "r", encoding="utf-8") as file:
+                        content = file.read()
+                touch(entry_path)  # keep track of the last access across runs and processes
+            except FileNotFoundError:  # not in the cache, or evicted by another process
+                continue
+            self.hits += 1
+            return content
+        self.misses += 1
+        return None
+
+    def put(self, key, content):
+        """
+        Store parsed content in the cache, evicting the least recently used entries if the cache is full
+        :param key: cache key
+        :param content: parsed content
+        :return: None
+        """
+        self.remove(key)
+        entry_path = self.get_path(key, self.compress)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        data = content.encode("utf-8")
+        if self.compress:
+            data = gzip.compress(data)
+        # each writer has its own temporary file, readers never see partially written entries
+        descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(entry_path), suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(data)
+            os.replace(temporary_path, entry_path)
+            touch(entry_path)
+            if self.size is not None:
+                self.size += len(data)
+        except FileNotFoundError:  # the directory was removed by another process, the entry is just not cached
+            pass
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+        self.puts += 1
+        if self.size is None or self.size > self.max_size or self.puts >= self.scan_interval:
+            self.evict()
+
+    def evict(self):
+        """
+        Scan the cache directory and, if the size of the cached content (on disk) is above the maximum size, evict the
+        least recently used entries until it is below the eviction watermark
+        :return: None
+        """
+        entries = self.scan_entries()
+        self.size = sum(size for _, _, size in entries)
+        self.puts = 0
+        if self.size <= self.max_size:
+            return
+        for _, entry_path, size in entries:
+            if self.size <= self.max_size * eviction_watermark:
+                break
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:  # already evicted by another process
+                pass
+            self.size -= size
+
+    def remove(self, key):
+        """
+        Remove an entry from the cache
+        :param key: cache key
+        :return: None
+        """
+        for compressed in (False, True):
+            entry_path = self.get_path(key, compressed)
+            try:
+                size = os.stat(entry_path).st_size
+                os.remove(entry_path)
+            except FileNotFoundError:
+                continue
+            if self.size is not None:
+                self.size -= size
+
+    def statistics(self):
+        """
+        Get cache statistics
+        :return: hits and misses of this process, and size of the cached content
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": self.size}
+
+    def get_or_parse(self, file, parse_function, settings=None):
+        """
+        Get parsed content of a file from the cache, parsing the file if it is not in the cache
+        :param file: file path
+        :param parse_function: function parsing a file and returning its textual content
+        :param settings: parser settings (JSON serializable)
+        :return: parsed content of the file
+        """
+        key = self.get_key(file, settings)
+        content = self.get(key)
+        if content is None:
+            content = parse_function(file)
+            if content is None:  # Apache Tika returns no content for empty documents
+                content = ""
+            self.put(key, content)
+        return content
@@ -1,27 +1,232 @@
 #!/usr/bin/env python
 
-from sapientia.io.io import load_files, create_file, append_file
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from sapientia.io.io import load_files, create_file, file_digest
 from sapientia.ocr.ocr import parse
-from sapientia.nlp.preprocessing.data_cleaning import sentences_cleaning, sentences_fixing, group_lists_in_sentences
+from sapientia.nlp.preprocessing.data_cleaning import preprocessing_pipeline, iter_sentences_cleaning, \
+    iter_group_lists_in_sentences, default_cleaning_rules_file
+from sapientia.nlp.preprocessing.sentence_segmentation import iter_sentences
 from sapientia.knowledge.knowledge_extraction import requirements_extraction
 
+# Version of the extraction of requirements, to increase when the format of the training data changes
+training_data_format_version = 2
+
+
+def training_data_line(requirement):
+    """
+    Format a requirement as a line of training data
+    :param requirement: requirement
+    :return: training data line (jsonl format)
+    """
+    return "{ \"text\":" + "\"" + str(requirement) + "\"}\n"
+
+
+def extract_file_requirements(file, cache=None, abbreviations=None):
+    """
+    Parse a file and extract its requirements
+    :param file: file path
+    :param cache: parse cache (ParseCache) used to avoid parsing the same content twice
+    :param abbreviations: abbreviations used by sentence segmentation
+    :return: requirements found in the file, time spent (in seconds) in the parsing and cleaning stages, and whether
+    the parsed content was found in the cache
+    """
+    start = time.perf_counter()
+    hits = cache.hits if cache is not None else 0
+    content = parse(file, cache)
+    cache_hit = cache is not None and cache.hits > hits  # workers have their own copy of the cache
+    if content is None:  # Apache Tika returns no content for empty documents
+        content = ""
+    parsed = time.perf_counter()
+    sentences = iter_sentences(content, abbreviations)  # e.g. and ref. don't split sentences
+    sentences = preprocessing_pipeline(sentences, [iter_sentences_cleaning, iter_group_lists_in_sentences])
+    requirements = requirements_extraction(sentences)
+    cleaned = time.perf_counter()
+    return requirements, {"parse": parsed - start, "cleaning": cleaned - parsed, "cache_hit": cache_hit}
+
+
+def stage_throughput(files, seconds):
+    """
+    Compute the throughput of a stage of the workflow
+    :param files: number of files processed by the stage
+    :param seconds: time spent in the stage
+    :return: time spent and number of files processed per second
+    """
+    return {"seconds": seconds, "files_per_second": files / seconds if seconds > 0 else 0.0}
+
+
+def get_abbreviations_fingerprint(abbreviations):
+    """
+    Get the fingerprint of the abbreviations used by sentence segmentation (only abbreviations matter, not their
+    expansions)
+    :param abbreviations: abbreviations (any container, for example the abbreviations from get_abbreviations)
+    :return: content hash of the abbreviations, None if there are no abbreviations
+    """
+    if not abbreviations:
+        return None
+    if hasattr(abbreviations, "lexicon_file"):  # AbbreviationLexicon
+        return file_digest(abbreviations.lexicon_file)
+    words = [word for word, _ in abbreviations.items()] if hasattr(abbreviations, "items") else list(abbreviations)
+    return hashlib.sha256(json.dumps(sorted(words)).encode("utf8")).hexdigest()
+
+
+def get_pipeline_fingerprint(abbreviations=None):
+    """
+    Get the fingerprint of the settings used to extract requirements from files
+    :param abbreviations: abbreviations used by sentence segmentation
+    :return: hash of the format version, the cleaning rules and the abbreviations
+    """
+    settings = {
+        "format": training_data_format_version,
+        "cleaning_rules": file_digest(default_cleaning_rules_file),
+        "abbreviations": get_abbreviations_fingerprint(abbreviations)
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf8")).hexdigest()
+
+
+def get_manifest_path(target_file):
+    """
+    Get the path of the manifest associated with a training data file
+    :param target_file: target training data file
+    :return: manifest path (stored next to the training data file)
+    """
+    return str(target_file) + ".manifest.jsonl"
+
+
+def load_manifest(manifest_path):
+    """
+    Load the manifest of a previous training data build
+    :param manifest_path: manifest path
+    :return: manifest entries (path, modification time, size, content hash, pipeline fingerprint and requirements)
+    by file path
+    """
+    manifest = {}
+    if not os.path.exists(manifest_path):
+        return manifest
+    with open(manifest_path, "r") as manifest_file:
+        for line in manifest_file:
+            try:
+                entry = json.loads(line)
+            except ValueError:  # the last line might be truncated if a previous run crashed
+                continue
+            manifest[entry["path"]] = entry  # the latest entry of a file wins
+    return manifest
+
+
+def get_manifest_entry(file, manifest, pipeline=None):
+    """
+    Get the manifest entry of a file, computing its content hash only when its modification time or size changed
+    :param file: file path
+    :param manifest: manifest entries by file path
+    :param pipeline: fingerprint of the settings used to extract requirements (see get_pipeline_fingerprint)
+    :return: entry describing the current state of the file, and whether its previous requirements can be reused
+    (same content, and requirements extracted with the same settings)
+    """
+    stat = os.stat(file)
+    entry = {"path": file, "mtime": stat.st_mtime_ns, "size": stat.st_size, "pipeline": pipeline}
+    previous = manifest.get(file)
+    if previous is not None and previous["mtime"] == entry["mtime"] and previous["size"] == entry["size"]:
+        entry["sha256"] = previous["sha256"]
+    else:
+        entry["sha256"] = file_digest(file)
+    if previous is not None and previous["sha256"] == entry["sha256"] and previous.get("pipeline") == pipeline:
+        entry["requirements"] = previous["requirements"]
+        return entry, True
+    return entry, False
+
 
-def create_training_data(source_dir, target_file):
+def create_training_data(source_dir, target_file, workers=1, incremental=False, cache=None, abbreviations=None):
     """
     Create training data
+    Files are parsed and cleaned concurrently when several workers are used, requirements are always written in the
+    order of the files in the source directory.
+    In incremental mode, a manifest (path, modification time, content hash and requirements of each file) is stored
+    next to the target file. Files that did not change since the previous build are not parsed again, and a build
+    that crashed resumes from the files already processed. Requirements are extracted again when the settings
+    (format version, cleaning rules or abbreviations) changed.
     :param source_dir: source directory
     :param target_file: target training data file
-    :return: None
+    :param workers: number of processes used to parse and clean files
+    :param incremental: reuse requirements of unchanged files from the manifest of the previous build
+    :param cache: parse cache (ParseCache) used to avoid parsing the same content twice
+    :param abbreviations: abbreviations used by sentence segmentation (for example, from get_abbreviations)
+    :return: statistics (number of files, reused files and requirements, time spent and throughput of each stage,
+    parse cache hits and misses)
     """
+    start = time.perf_counter()
     files = load_files(source_dir)
     create_file(target_file)
+    timings = {"parse": 0.0, "cleaning": 0.0, "write": 0.0}
+    cache_hits = 0
+    nb_requirements = 0
+    manifest_path = get_manifest_path(target_file)
+    manifest = load_manifest(manifest_path) if incremental else {}
+    pipeline = get_pipeline_fingerprint(abbreviations) if incremental else None
+    entries = []  # manifest entries, in the order of files
+    reused = []
     for file in files:
-        content = parse(file)
-        sentences = content.split(". ")
-        sentences = sentences_cleaning(sentences)
-        sentences = sentences_fixing(sentences)
-        sentences = group_lists_in_sentences(sentences)
-        requirements = requirements_extraction(sentences)
-        for requirement in requirements:
-            training_data = "{ \"text\":" + "\"" + str(requirement) + "\"}\n"
-            append_file(target_file, training_data)
+        if incremental:
+            entry, is_reused = get_manifest_entry(file, manifest, pipeline)
+        else:
+            entry, is_reused = {"path": file}, False
+        entries.append(entry)
+        reused.append(is_reused)
+    files_to_parse = [entry["path"] for entry, is_reused in zip(entries, reused) if not is_reused]
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 and len(files_to_parse) > 1 else None
+    manifest_file = open(manifest_path, "a") if incremental else None  # journal of processed files
+    extract = partial(extract_file_requirements, cache=cache, abbreviations=abbreviations)
+    try:
+        if executor is not None:
+            results = executor.map(extract, files_to_parse)  # results are yielded in the order of files
+        else:
+            results = map(extract, files_to_parse)
+        with open(target_file, "a") as training_data:  # single writer for the whole run
+            for entry, is_reused in zip(entries, reused):
+                if not is_reused:
+                    requirements, file_timings = next(results)
+                    timings["parse"] += file_timings["parse"]
+                    timings["cleaning"] += file_timings["cleaning"]
+                    cache_hits += file_timings["cache_hit"]
+                    entry["requirements"] = requirements
+                written = time.perf_counter()
+                for requirement in entry["requirements"]:
+                    training_data.write(training_data_line(requirement))
+                timings["write"] += time.perf_counter() - written
+                nb_requirements += len(entry["requirements"])
+                if manifest_file is not None and (not is_reused or manifest[entry["path"]] != entry):
+                    training_data.flush()  # requirements are written before the file is recorded as processed
+                    manifest_file.write(json.dumps(entry) + "\n")
+                    manifest_file.flush()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if manifest_file is not None:
+            manifest_file.close()
+    if incremental:  # compact the journal so that it only describes the current files
+        with open(manifest_path + ".tmp", "w") as manifest_file:
+            for entry in entries:
+                manifest_file.write(json.dumps(entry) + "\n")
+        os.replace(manifest_path + ".tmp", manifest_path)
+    nb_parsed = len(files_to_parse)
+    elapsed = time.perf_counter() - start
+    statistics = {
+        "files": len(files),
+        "reused": len(files) - nb_parsed,
+        "requirements": nb_requirements,
+        "workers": workers,
+        "elapsed": elapsed,
+        "throughput": len(files) / elapsed if elapsed > 0 else 0.0,
+        "stages": {
+            "parse": stage_throughput(nb_parsed, timings["parse"]),
+            "cleaning": stage_throughput(nb_parsed, timings["cleaning"]),
+            "write": stage_throughput(len(files), timings["write"])
+        }
+    }
+    if cache is not None:
+        statistics["cache"] = {"hits": cache_hits, "misses": nb_parsed - cache_hits}
+    return statistics
@@ -1,7 +1,7 @@
 import unittest
 from pathlib import PosixPath
 
-from sapientia.io.io import load_files, replace_extension
+from sapientia.io.io import load_files, replace_extension, file_digest
 
 
 class TestIO(unittest.TestCase):
@@ -14,6 +14,12 @@ class TestIO(unittest.TestCase):
         new_file = replace_extension("data/subdirectory/4.txt", ".doc")
         self.assertEqual(new_file, PosixPath("data/subdirectory/4.doc"))
 
+    def test_file_digest(self):
+        digest = file_digest("data/1.txt")
+        self.assertEqual(len(digest), 64)
+        self.assertEqual(digest, file_digest("data/1.txt", block_size=1))
+        self.assertNotEqual(digest, file_digest("data/subdirectory/4.txt"))
+
 
 if __name__ == '__main__':
     unittest.main()
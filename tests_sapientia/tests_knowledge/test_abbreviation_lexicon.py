@@ -0,0 +1,42 @@
+import os
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+
+from sapientia.knowledge.knowledge_extraction import get_abbreviations
+from sapientia.knowledge.abbreviation_lexicon import compile_abbreviations, load_abbreviation_lexicon
+
+
+class TestAbbreviationLexicon(unittest.TestCase):
+    def test_load_abbreviation_lexicon(self):
+        abbreviations = get_abbreviations("abbreviations.csv")
+        with tempfile.TemporaryDirectory() as directory:
+            lexicon = load_abbreviation_lexicon("abbreviations.csv", os.path.join(directory, "abbreviations.lexicon"))
+            self.assertEqual(len(lexicon), len(abbreviations))
+            self.assertEqual(dict(lexicon.items()), abbreviations)
+            self.assertEqual(lexicon["EMA"], abbreviations["EMA"])
+            self.assertIn("ECU", lexicon)
+            self.assertNotIn("UNKNOWN", lexicon)
+            self.assertEqual(lexicon.expand("UNKNOWN"), "UNKNOWN")
+            self.assertEqual(lexicon.expand_text("The ECU (CPU)"),
+                             "The Electronic Control Unit (Central Processing Unit)")
+            unpickled_lexicon = pickle.loads(pickle.dumps(lexicon))  # as sent to worker processes
+            self.assertEqual(unpickled_lexicon.get("EMA"), abbreviations["EMA"])
+            unpickled_lexicon.close()
+            lexicon.close()
+
+    def test_compile_abbreviations_temporary_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            lexicon_file = os.path.join(directory, "abbreviations.lexicon")
+            compile_abbreviations("abbreviations.csv", lexicon_file)
+            self.assertEqual(os.listdir(directory), ["abbreviations.lexicon"])
+            # a failed compilation leaves the previous lexicon and no temporary file behind
+            with mock.patch("sapientia.knowledge.abbreviation_lexicon.os.replace", side_effect=OSError):
+                with self.assertRaises(OSError):
+                    compile_abbreviations("abbreviations.csv", lexicon_file)
+            self.assertEqual(os.listdir(directory), ["abbreviations.lexicon"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 
-from sapientia.knowledge.knowledge_extraction import requirements_extraction, get_abbreviations
+from sapientia.knowledge.knowledge_extraction import requirements_extraction, get_abbreviations, \
+    classify_requirements
 
 
 class TestKnowledgeExtraction(unittest.TestCase):
@@ -11,6 +12,12 @@ class TestKnowledgeExtraction(unittest.TestCase):
         print(requirements)
         self.assertEqual(requirements, ['The code must be documented.', 'The code will be tested'])
 
+    def test_classify_requirements(self):
+        sentences = iter(["The mayor is willing to sign.", "The code must be documented.", "It may, or shall, work"])
+        requirements = list(classify_requirements(sentences))
+        self.assertEqual(requirements, [(1, 'The code must be documented.', 'must'),
+                                        (2, 'It may, or shall, work', 'may')])
+
     def test_get_abbreviations(self):
         abbreviations_file = "abbreviations.csv"
         abbreviations = get_abbreviations(abbreviations_file)
@@ -1,6 +1,7 @@
 import unittest
 
-from sapientia.language_detection.language_detection import detect_language
+from sapientia.language_detection.language_detection import detect_language, detect_language_sampled, \
+    detect_language_segments, sample_windows
 
 
 class TestLanguageDetection(unittest.TestCase):
@@ -10,6 +11,33 @@ class TestLanguageDetection(unittest.TestCase):
     def test_detect_language_french(self):
         self.assertEqual(detect_language("Ce texte est écrit en français."), "fr")
 
+    def test_detect_language_sampled(self):
+        language, probability = detect_language_sampled("This is a text written in English.")
+        self.assertEqual(language, "en")
+        self.assertGreater(probability, 0.5)
+        text = "Ce texte est écrit en français et il est très long. " * 10000
+        language, probability = detect_language_sampled(text, sample_size=2000, window_size=200)
+        self.assertEqual(language, "fr")
+        self.assertEqual(detect_language_sampled(text, sample_size=2000, window_size=200), (language, probability))
+        # windows larger than the sample are clamped to the sample size
+        self.assertEqual(detect_language_sampled(text, sample_size=100)[0], "fr")
+
+    def test_sample_windows(self):
+        text = "Ce texte est écrit en français et il est très long. " * 100
+        windows = list(sample_windows(text, sample_size=100, window_size=500))
+        self.assertEqual(len(windows), 1)
+        self.assertLessEqual(len(windows[0]), 100)
+        with self.assertRaises(ValueError):
+            list(sample_windows(text, sample_size=0, window_size=500))
+
+    def test_detect_language_segments(self):
+        english = "This paragraph of the specification is written in English. " * 5
+        french = "Ce paragraphe de la spécification est écrit en français. " * 5
+        text = english + "\n\n" + english + "\n\n" + french
+        spans = detect_language_segments(text)
+        self.assertEqual([language for start, end, language in spans], ["en", "fr"])
+        self.assertEqual(text[spans[1][0]:spans[1][1]], french)
+
 
 if __name__ == '__main__':
     unittest.main()
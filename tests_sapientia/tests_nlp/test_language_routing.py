@@ -0,0 +1,32 @@
+import unittest
+
+from sapientia.nlp.language_routing import LanguageRouter
+
+
+class TestLanguageRouting(unittest.TestCase):
+
+    def test_pipe(self):
+        texts = ["Apple is looking at buying U.K. startup for $1 billion", "Ce texte est écrit en français.", "1234"]
+        router = LanguageRouter(buffer_size=2)
+        routed = list(router.pipe(texts))
+        self.assertEqual([language for language, doc in routed], ["en", "fr", None])
+        self.assertEqual([doc.text for language, doc in routed], texts)
+        self.assertEqual(routed[0][1].lang_, "en")
+        self.assertEqual(routed[1][1].lang_, "fr")
+        self.assertEqual(routed[2][1].lang_, "en")  # fallback model
+
+    def test_named_entity_recognition(self):
+        english = "Apple is looking at buying U.K. startup for $1 billion. " * 5
+        french = "Emmanuel Macron est le président de la République française depuis 2017. " * 5
+        text = english + "\n\n" + french
+        router = LanguageRouter()
+        spans = [(start, end, language) for start, end, language, doc in router.pipe_segments(text)]
+        self.assertEqual([language for start, end, language in spans], ["en", "fr"])
+        named_entities = router.named_entity_recognition(text)
+        for named_entity in named_entities:
+            self.assertEqual(text[named_entity["start_char"]:named_entity["end_char"]], named_entity["text"])
+        self.assertIn("fr", [named_entity["language"] for named_entity in named_entities])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,23 @@
 import unittest
+from unittest import mock
+
+import numpy
 import spacy
+from spacy.tokens import Doc, Span
+from spacy.ml.models import build_hash_embed_cnn_tok2vec
+from spacy.scorer import PRFScore
+from spacy.training.example import Example
+from spacy.vocab import Vocab
+from thinc.api import Model, reduce_mean
 import sapientia.nlp.components.rel_component.scripts.rel_model
-from sapientia.nlp.components.rel_component.scripts.rel_pipe import make_relation_extractor
+from sapientia.nlp.components.rel_component.scripts.rel_model import create_instances, get_instance_indices, \
+    create_relation_model, create_classification_layer, create_tensors
+from sapientia.nlp.components.rel_component.scripts.rel_pipe import make_relation_extractor, RelationExtractor, \
+    score_relations, score_relations_sweep
 
 from sapientia.nlp.nlp import load_model, apply_model, tokenize, named_entity_recognition, named_entities_to_triples, \
-    relations_to_triples
+    relations_to_triples, apply_model_batch, tokenize_batch, named_entity_recognition_batch, \
+    relations_to_triples_batch, extract_knowledge_batch, ModelRegistry, relation_scores_to_triples
 
 class TestNLP(unittest.TestCase):
 
@@ -48,5 +61,343 @@ class TestNLP(unittest.TestCase):
         triples = relations_to_triples(relations, doc)
         print(triples)
 
+    def test_apply_model_batch(self):
+        model = "en_core_web_sm"
+        texts = ["Apple is looking at buying U.K. startup for $1 billion", "This is a sentence"]
+        nlp = load_model(model)
+        docs = list(apply_model_batch(nlp, texts, batch_size=1, n_process=2))
+        self.assertEqual([doc.text for doc in docs], texts)
+        tokens = list(tokenize_batch(docs))
+        self.assertEqual(len(tokens[0]), 11)
+        named_entities = list(named_entity_recognition_batch(docs))
+        self.assertEqual(named_entities[0], named_entity_recognition(apply_model(nlp, texts[0])))
+
+    def test_relations_to_triples_batch(self):
+        model = "rel_collins_en"  # a NLP model trained for relation extraction
+        texts = ["Under supplier request, the Purchaser will provide documents identified in this section except the "
+                 "external standards available on the market ", "The supplier provides the ECU."]
+        nlp = load_model(model)
+        docs = list(apply_model_batch(nlp, texts))
+        triples = list(relations_to_triples_batch(docs))
+        self.assertEqual(triples[0], relations_to_triples(docs[0]._.rel, docs[0]))
+        knowledge = list(extract_knowledge_batch(nlp, texts))
+        self.assertEqual(knowledge[1]["relations"], triples[1])
+
+    def test_relation_scores_to_triples(self):
+        model = "rel_collins_en"  # a NLP model trained for relation extraction
+        texts = ["Under supplier request, the Purchaser will provide documents identified in this section except the "
+                 "external standards available on the market ", "The supplier provides the ECU."]
+        nlp = load_model(model)
+        threshold = nlp.get_pipe("relation_extractor").threshold
+        for doc in list(nlp.pipe(texts, batch_size=2)) + [nlp(text) for text in texts]:
+            # the component is sparse: doc._.rel only keeps the labels above the threshold
+            self.assertEqual(relation_scores_to_triples(doc._.rel_scores, doc, threshold=threshold),
+                             relations_to_triples(doc._.rel, doc))
+            self.assertEqual(len(relation_scores_to_triples(doc._.rel_scores, doc)), len(doc._.rel_scores["pairs"]))
+
+    def test_model_registry(self):
+        registry = ModelRegistry(max_models=1)
+        nlp = registry.get("en_core_web_sm")
+        self.assertIs(registry.get("en_core_web_sm"), nlp)
+        nlp_without_parser = registry.get("en_core_web_sm", disable=["parser"])
+        self.assertIsNot(nlp_without_parser, nlp)
+        self.assertNotIn("parser", nlp_without_parser.pipe_names)
+        self.assertEqual(len(registry.models), 1)
+        self.assertIsNot(registry.get("en_core_web_sm"), nlp)  # released when the second model was loaded
+
+
+def relation_doc(entities, length=40):
+    """
+    Create a Doc with one token entities
+    :param entities: list of (token index, label) of the entities
+    :param length: number of tokens of the Doc
+    :return: Doc
+    """
+    doc = Doc(Vocab(), words=["w%d" % i for i in range(length)])
+    doc.ents = [doc.char_span(doc[start].idx, doc[start].idx + len(doc[start]), label=label)
+                for start, label in entities]
+    return doc
+
+
+def relation_extractor_model(labels, max_length, sparse=False):
+    """
+    Create a small relation extractor, initialized but not trained
+    :param labels: relation labels
+    :param max_length: maximal distance between the starts of the entities of an instance
+    :param sparse: whether doc._.rel only keeps the labels above the threshold
+    :return: RelationExtractor
+    """
+    tok2vec = build_hash_embed_cnn_tok2vec(width=8, depth=1, embed_size=50, window_size=1, maxout_pieces=2,
+                                           subword_features=False, pretrained_vectors=None)
+    instance_tensor = create_tensors(tok2vec, reduce_mean(), create_instances(max_length))
+    model = create_relation_model(instance_tensor, create_classification_layer())
+    relation_extractor = RelationExtractor(Vocab(), model, threshold=0.5, sparse=sparse)
+    for label in labels:
+        relation_extractor.add_label(label)
+    docs = [relation_doc([(0, "ACTOR"), (2, "SYSTEM")])]
+    model.initialize(X=docs, Y=model.ops.alloc2f(2, len(labels)))
+    return relation_extractor
+
+
+def token_vectors_model(token_vectors):
+    """
+    Create a tok2vec stub returning fixed token vectors, the gradient of the token vectors is kept in its attributes
+    :param token_vectors: list of token vectors (one array for each doc)
+    :return: Model
+    """
+    def forward(model, docs, is_train):
+        def backprop(d_token_vectors):
+            model.attrs["d_token_vectors"] = d_token_vectors
+            return docs
+
+        return [model.ops.asarray2f(token_vectors[doc.user_data["index"]]) for doc in docs], backprop
+
+    return Model("token_vectors", forward, attrs={"d_token_vectors": None})
+
+
+def pooling_model(pooled_lengths):
+    """
+    Create a mean pooling layer recording the lengths of the pooled spans
+    :param pooled_lengths: list extended with the lengths of the pooled spans
+    :return: Model
+    """
+    mean = reduce_mean()
+
+    def forward(model, spans, is_train):
+        pooled_lengths.extend(spans.lengths.tolist())
+        return mean(spans, is_train)
+
+    return Model("recorded_mean", forward, layers=[mean])
+
+
+def get_instances_loop(doc, max_length):
+    """
+    Candidate instances generated with the nested loop of the first version of create_instances
+    :param doc: Doc
+    :param max_length: maximal distance between the starts of the entities
+    :return: list of pairs of entities
+    """
+    instances = []
+    for ent1 in doc.ents:
+        for ent2 in doc.ents:
+            if ent1 != ent2:
+                if max_length and abs(ent2.start - ent1.start) <= max_length:
+                    instances.append((ent1, ent2))
+    return instances
+
+
+class TestRelationModel(unittest.TestCase):
+
+    def test_get_instance_indices(self):
+        random = numpy.random.RandomState(0)
+        for max_length in (0, 1, 3, 10, 100):
+            for nb_entities in (0, 1, 2, 15):
+                starts = numpy.sort(random.choice(60, nb_entities, replace=False)).astype("int64")
+                firsts, seconds = get_instance_indices(starts, max_length)
+                expected = [(i, j) for i in range(nb_entities) for j in range(nb_entities)
+                            if i != j and abs(starts[j] - starts[i]) <= max_length]
+                self.assertEqual(list(zip(firsts.tolist(), seconds.tolist())), expected)
+
+    def test_create_instances(self):
+        random = numpy.random.RandomState(0)
+        for max_length in (0, 1, 5, 20, 100):
+            starts = sorted(random.choice(40, 12, replace=False).tolist())
+            doc = relation_doc([(start, "ENTITY") for start in starts])
+            instances = create_instances(max_length)(doc)
+            # same instances in the same order as the nested loop
+            self.assertEqual([(ent1.start, ent2.start) for ent1, ent2 in instances],
+                             [(ent1.start, ent2.start) for ent1, ent2 in get_instances_loop(doc, max_length)])
+
+    def test_create_instances_label_pairs(self):
+        doc = relation_doc([(0, "ACTOR"), (2, "SYSTEM"), (4, "ACTOR"), (6, "VALUE"), (30, "SYSTEM")])
+        get_instances = create_instances(10, label_pairs=[["ACTOR", "SYSTEM"], ["SYSTEM", "VALUE"]])
+        instances = [(ent1.start, ent2.start) for ent1, ent2 in get_instances(doc)]
+        self.assertEqual(instances, [(0, 2), (2, 6), (4, 2)])
+        expected = [(ent1.start, ent2.start) for ent1, ent2 in get_instances_loop(doc, 10)
+                    if (ent1.label_, ent2.label_) in {("ACTOR", "SYSTEM"), ("SYSTEM", "VALUE")}]
+        self.assertEqual(instances, expected)
+        self.assertEqual(create_instances(10, label_pairs=[["VALUE", "VALUE"]])(doc), [])
+
+    def test_create_instances_cache(self):
+        doc = relation_doc([(0, "ACTOR"), (2, "SYSTEM"), (4, "VALUE")])
+        get_instances = create_instances(3)
+        with mock.patch("sapientia.nlp.components.rel_component.scripts.rel_model.get_instance_indices",
+                        wraps=get_instance_indices) as instance_indices:
+            instances = get_instances(doc)
+            self.assertEqual(get_instances(doc), instances)  # computed once for the same entities
+            self.assertEqual(instance_indices.call_count, 1)
+            doc.ents = [doc.ents[0], doc.ents[1]]  # the cached instances are invalidated by new entities
+            self.assertEqual([(ent1.start, ent2.start) for ent1, ent2 in get_instances(doc)], [(0, 2), (2, 0)])
+            self.assertEqual(instance_indices.call_count, 2)
+            doc.ents = [doc.ents[0], doc.char_span(doc[2].idx, doc[2].idx + len(doc[2]), label="ACTOR")]
+            self.assertEqual(get_instances(doc)[0][1].label_, "ACTOR")
+            self.assertEqual(instance_indices.call_count, 3)
+            # other instance generators keep their own instances
+            self.assertEqual(create_instances(1)(doc), [])
+            self.assertEqual(len(get_instances(doc)), 2)
+            self.assertEqual(instance_indices.call_count, 4)
+
+    def test_instance_backprop(self):
+        random = numpy.random.RandomState(0)
+        docs = [relation_doc([], length=8), relation_doc([], length=3), relation_doc([(1, "A"), (2, "B")], length=4)]
+        docs[0].ents = [Span(docs[0], 0, 1, "A"), Span(docs[0], 3, 5, "B"), Span(docs[0], 6, 7, "C")]
+        token_vectors = [random.uniform(-1, 1, (len(doc), 4)).astype("f") for doc in docs]
+        for index, doc in enumerate(docs):
+            doc.user_data["index"] = index
+        pooled_lengths = []
+        model = create_tensors(token_vectors_model(token_vectors), pooling_model(pooled_lengths), create_instances(3))
+        relations, backprop = model(docs, is_train=True)
+
+        # reference: each instance is the concatenation of the mean vectors of its entities
+        all_instances = [model.attrs["get_instances"](doc) for doc in docs]
+        expected = [numpy.concatenate([token_vectors[index][ent.start:ent.end].mean(axis=0) for ent in instance])
+                    for index, instances in enumerate(all_instances) for instance in instances]
+        self.assertEqual(relations.shape, (len(expected), 8))
+        numpy.testing.assert_allclose(relations, expected, rtol=1e-5)
+        # each entity of the batch is pooled once, however many instances it is in
+        self.assertEqual(sorted(pooled_lengths), [1, 1, 1, 1, 2])
+
+        # gradient of sum(relations * d_relations), summed over the instances of each entity
+        d_relations = random.uniform(-1, 1, relations.shape).astype("f")
+        backprop(d_relations)
+        d_token_vectors = model.get_ref("tok2vec").attrs["d_token_vectors"]
+        expected_d_token_vectors = [numpy.zeros_like(vectors) for vectors in token_vectors]
+        row = 0
+        for index, instances in enumerate(all_instances):
+            for instance in instances:
+                for position, ent in enumerate(instance):
+                    d_ent = d_relations[row, position * 4:(position + 1) * 4] / len(ent)
+                    expected_d_token_vectors[index][ent.start:ent.end] += d_ent
+                row += 1
+        for d_vectors, expected_d_vectors in zip(d_token_vectors, expected_d_token_vectors):
+            numpy.testing.assert_allclose(d_vectors, expected_d_vectors, rtol=1e-5, atol=1e-6)
+
+        # finite differences on the token vectors of entities shared by several instances
+        epsilon = 1e-2
+        for token, dimension in ((3, 0), (4, 2), (0, 1)):
+            shifted = [vectors.copy() for vectors in token_vectors]
+            shifted[0][token, dimension] += epsilon
+            shifted_model = create_tensors(token_vectors_model(shifted), reduce_mean(), create_instances(3))
+            shifted_relations, _ = shifted_model(docs, is_train=False)
+            gradient = ((shifted_relations - relations) * d_relations).sum() / epsilon
+            self.assertAlmostEqual(gradient, d_token_vectors[0][token, dimension], places=3)
+
+
+class TestRelationExtractor(unittest.TestCase):
+
+    def test_relation_extractor_without_instances(self):
+        for sparse in (False, True):
+            relation_extractor = relation_extractor_model(["PROVIDE", "APPROVAL"], 3, sparse=sparse)
+            docs = [relation_doc([(0, "ACTOR"), (2, "SYSTEM")]), relation_doc([(0, "ACTOR"), (20, "SYSTEM")]),
+                    relation_doc([])]
+            # the same annotations with and without batching, including docs without candidate instances
+            for doc in [relation_extractor(doc) for doc in docs] + list(relation_extractor.pipe(docs)):
+                self.assertEqual(doc._.rel_scores["labels"], ["PROVIDE", "APPROVAL"])
+                self.assertEqual(doc._.rel_scores["scores"].shape, (len(doc._.rel_scores["pairs"]), 2))
+            self.assertEqual(docs[0]._.rel_scores["pairs"].tolist(), [[0, 2], [2, 0]])
+            above_threshold = (docs[0]._.rel_scores["scores"] >= relation_extractor.threshold).any(axis=1)
+            self.assertEqual(len(docs[0]._.rel), int(above_threshold.sum()) if sparse else 2)
+            for doc in docs[1:]:
+                self.assertEqual(doc._.rel_scores["pairs"].shape, (0, 2))
+                self.assertEqual(doc._.rel, {})
+
+
+
+def relation_examples(labels, with_scores):
+    """
+    Create examples with random gold and predicted relations
+    :param labels: relation labels
+    :param with_scores: whether the predictions are stored in doc._.rel_scores (otherwise only in doc._.rel)
+    :return: list of examples
+    """
+    random = numpy.random.RandomState(0)
+    examples = []
+    for _ in range(5):
+        entities = [(start, "ENTITY") for start in sorted(random.choice(20, 4, replace=False).tolist())]
+        pred = relation_doc(entities, length=20)
+        gold = relation_doc(entities, length=20)
+        pairs = [(ent1.start, ent2.start) for ent1 in pred.ents for ent2 in pred.ents if ent1 != ent2]
+        # rounded scores, so that some scores are equal to the thresholds
+        scores = random.uniform(0, 1, (len(pairs), len(labels))).round(1).astype("f")
+        pred._.rel = {pair: dict(zip(labels, row)) for pair, row in zip(pairs, scores.tolist())}
+        if with_scores:
+            pred._.rel_scores = {"labels": labels, "pairs": numpy.asarray(pairs, dtype="i"), "scores": scores}
+        gold._.rel = {pair: {label: 1.0 for label in labels if random.uniform() < 0.3} for pair in pairs}
+        examples.append(Example(pred, gold))
+    return examples
+
+
+def score_relations_loop(examples, threshold, label=None):
+    """
+    Score relations with PRFScore, looping over the predicted relations of doc._.rel
+    :param examples: list of examples
+    :param threshold: threshold above which a prediction is seen as true
+    :param label: only score the predictions of this label (optional)
+    :return: PRFScore
+    """
+    score = PRFScore()
+    for example in examples:
+        gold = example.reference._.rel
+        for key, pred_dict in example.predicted._.rel.items():
+            gold_labels = [k for (k, v) in gold.get(key, {}).items() if v == 1.0]
+            for k, v in pred_dict.items():
+                if label is not None and k != label:
+                    continue
+                if v >= threshold:
+                    if k in gold_labels:
+                        score.tp += 1
+                    else:
+                        score.fp += 1
+                elif k in gold_labels:
+                    score.fn += 1
+    return score
+
+
+class TestRelationScores(unittest.TestCase):
+
+    def test_score_relations(self):
+        labels = ["PROVIDE", "APPROVAL", "PERFORM"]
+        thresholds = [0.0, 0.3, 0.5, 0.9, 1.0]
+        for with_scores in (False, True):
+            examples = relation_examples(labels, with_scores)
+            sweep = score_relations_sweep(examples, thresholds)
+            for threshold, micro in zip(thresholds, sweep["micro"]):
+                expected = score_relations_loop(examples, threshold)
+                scores = score_relations(examples, threshold)
+                self.assertAlmostEqual(scores["rel_micro_p"], expected.precision)
+                self.assertAlmostEqual(scores["rel_micro_r"], expected.recall)
+                self.assertAlmostEqual(scores["rel_micro_f"], expected.fscore)
+                self.assertEqual(micro, scores)
+
+    def test_score_relations_per_label(self):
+        labels = ["PROVIDE", "APPROVAL", "PERFORM"]
+        thresholds = [0.0, 0.3, 0.5, 0.9, 1.0]
+        for with_scores in (False, True):
+            examples = relation_examples(labels, with_scores)
+            sweep = score_relations_sweep(examples, thresholds)
+            self.assertEqual(sorted(sweep["per_label"]), sorted(labels))
+            for label in labels:
+                for threshold, scores in zip(thresholds, sweep["per_label"][label]):
+                    expected = score_relations_loop(examples, threshold, label=label)
+                    self.assertAlmostEqual(scores["p"], expected.precision)
+                    self.assertAlmostEqual(scores["r"], expected.recall)
+                    self.assertAlmostEqual(scores["f"], expected.fscore)
+
+    def test_score_relations_pr_curve(self):
+        examples = relation_examples(["PROVIDE", "APPROVAL"], with_scores=True)
+        curve = score_relations_sweep(examples, [0.5])["pr_curve"]
+        self.assertEqual(curve["thresholds"], sorted(set(curve["thresholds"]), reverse=True))
+        for threshold, precision, recall in zip(curve["thresholds"], curve["precision"], curve["recall"]):
+            expected = score_relations_loop(examples, threshold)
+            self.assertAlmostEqual(precision, expected.precision)
+            self.assertAlmostEqual(recall, expected.recall)
+        # the curve is capped, from the highest to the lowest predicted score
+        capped_curve = score_relations_sweep(examples, [0.5], max_curve_points=4)["pr_curve"]
+        self.assertEqual(len(capped_curve["thresholds"]), 4)
+        self.assertEqual(capped_curve["thresholds"][0], curve["thresholds"][0])
+        self.assertEqual(capped_curve["thresholds"][-1], curve["thresholds"][-1])
+        self.assertEqual(capped_curve["recall"][-1], curve["recall"][-1])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,124 @@
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from spacy.tokens import DocBin
+from spacy.vocab import Vocab
+
+from sapientia.nlp.components.rel_component.scripts.parse_data_generic import get_source_key, get_split, \
+    convert_shard, get_docbin_files, main, SPLITS
+
+
+def annotation(text, source, relations=(("supplier", "ECU", "PROVIDE"),), answer="accept"):
+    """
+    Create a Prodigy annotation of a sentence, its entities are the words starting with an s or a capital letter
+    (except the first word)
+    :param text: sentence (words separated by spaces)
+    :param source: source document of the sentence
+    :param relations: list of (head word, child word, label)
+    :param answer: answer of the annotator
+    :return: annotation
+    """
+    words = text.split(" ")
+    tokens = []
+    spans = []
+    start = 0
+    for i, word in enumerate(words):
+        tokens.append({"text": word, "start": start, "end": start + len(word), "id": i, "ws": i < len(words) - 1})
+        if (word[0].isupper() and i > 0) or word.startswith("s"):
+            spans.append({"start": start, "end": start + len(word), "token_start": i, "token_end": i,
+                          "label": "ENTITY"})
+        start += len(word) + 1
+    return {
+        "text": text,
+        "tokens": tokens,
+        "spans": spans,
+        "relations": [{"head": words.index(head), "child": words.index(child), "label": label}
+                      for head, child, label in relations],
+        "meta": {"source": source},
+        "answer": answer,
+    }
+
+
+class TestParseDataGeneric(unittest.TestCase):
+    def test_get_source_key(self):
+        self.assertEqual(get_source_key({"meta": {"source": "a.pdf", "file": "b.pdf"}, "text": "T"}), "a.pdf")
+        self.assertEqual(get_source_key({"meta": {"file": "b.pdf", "doc_id": 3}, "text": "T"}), "b.pdf")
+        self.assertEqual(get_source_key({"meta": {"doc_id": 3}, "text": "T"}), "3")
+        self.assertEqual(get_source_key({"_input_hash": 42, "text": "T"}), "42")
+        self.assertEqual(get_source_key({"text": "T"}), "T")
+
+    def test_get_split(self):
+        keys = ["document_%d.pdf" % i for i in range(2000)]
+        splits = [get_split(key, seed=0) for key in keys]
+        self.assertEqual(splits, [get_split(key, seed=0) for key in keys])  # reproducible with the same seed
+        self.assertNotEqual(splits, [get_split(key, seed=1) for key in keys])
+        self.assertEqual(set(splits), set(SPLITS))
+        self.assertAlmostEqual(splits.count("test") / len(keys), 0.1, delta=0.02)
+        self.assertAlmostEqual(splits.count("dev") / len(keys), 0.1, delta=0.02)
+
+    def test_convert_shard(self):
+        lines = [json.dumps(example) for example in [
+            annotation("The supplier provides the ECU .", "a.pdf"),
+            annotation("The supplier tests the ECU .", "a.pdf", relations=(("ECU", "supplier", "COLLABORATION"),)),
+            annotation("The supplier sells the ECU .", "a.pdf", relations=()),  # no positive relation
+            annotation("The supplier repairs the ECU .", "b.pdf", answer="reject"),
+        ]]
+        with tempfile.TemporaryDirectory() as directory:
+            dirs = {split: Path(directory, split) for split in SPLITS}
+            for split_dir in dirs.values():
+                split_dir.mkdir()
+            counts = convert_shard(3, lines, dirs, seed=0)
+            # all the sentences of a document are in the same split
+            split = get_split("a.pdf", seed=0)
+            self.assertEqual(counts[split], {"docs": 2, "pos": 3, "all": 3})
+            for other_split in SPLITS:
+                if other_split != split:
+                    self.assertEqual(counts[other_split]["docs"], 0)
+                    self.assertEqual(get_docbin_files(dirs[other_split]), [])
+            self.assertEqual([path.name for path in get_docbin_files(dirs[split])], ["rel-shard-00003.spacy"])
+            docs = list(DocBin(store_user_data=True).from_disk(dirs[split] / "rel-shard-00003.spacy")
+                        .get_docs(Vocab()))
+            # only positive relations are stored, symmetrical relations in both directions
+            self.assertEqual(docs[0]._.rel, {(1, 4): {"PROVIDE": 1.0}})
+            self.assertEqual(docs[1]._.rel, {(4, 1): {"COLLABORATION": 1.0}, (1, 4): {"COLLABORATION": 1.0}})
+            self.assertFalse(docs[0]._.rel_complete)
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as directory:
+            annotations = Path(directory, "annotations.jsonl")
+            with open(annotations, "w", encoding="utf8") as file:
+                for i in range(30):
+                    file.write(json.dumps(annotation("The supplier provides the ECU .", "%d.pdf" % i)) + "\n")
+            dirs = [Path(directory, "data", split) for split in SPLITS]
+            dirs[0].mkdir(parents=True)
+            user_file = dirs[0] / "other.spacy"
+            user_file.write_bytes(b"user data")
+            previous_shard = dirs[0] / "rel-shard-00099.spacy"
+            previous_shard.write_bytes(b"previous conversion")
+            main(annotations, *dirs, workers=1, shard_size=7, seed=0)
+            # previous shards are removed, other files are kept
+            self.assertFalse(previous_shard.exists())
+            self.assertEqual(user_file.read_bytes(), b"user data")
+            docs = [doc for split_dir in dirs for docbin_file in get_docbin_files(split_dir)
+                    for doc in DocBin(store_user_data=True).from_disk(docbin_file).get_docs(Vocab())]
+            self.assertEqual(len(docs), 30)
+            self.assertTrue(all(path.name.startswith("rel-shard-") for path in get_docbin_files(dirs[0])))
+
+    def test_main_existing_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            annotations = Path(directory, "annotations.jsonl")
+            annotations.write_text(json.dumps(annotation("The supplier provides the ECU .", "a.pdf")) + "\n")
+            train_file = Path(directory, "train.spacy")
+            train_file.write_bytes(b"user data")
+            with self.assertRaises(SystemExit):
+                main(annotations, train_file, Path(directory, "dev"), Path(directory, "test"),
+                     workers=1, shard_size=10, seed=0)
+            self.assertEqual(train_file.read_bytes(), b"user data")
+            self.assertEqual(sorted(os.listdir(directory)), ["annotations.jsonl", "train.spacy"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,12 +5,30 @@ from sapientia.nlp.components.rel_heuristic.relation_extraction import (extract_
                                                                         sentence_segmentation,
                                                                         get_named_entity_beginning_position,
                                                                         get_sentence_for_named_entity,
+                                                                        create_sentence_index,
+                                                                        get_sentence_start_for_position,
                                                                         get_sentence_start, get_sentence_end,
                                                                         is_in_sentence,
                                                                         associate_sentences_to_named_entities,
                                                                         extract_relation,
                                                                         create_new_relations_from_existing_relations,
-                                                                        has_more_specific_occurrence_in_triggering_text)
+                                                                        has_more_specific_occurrence_in_triggering_text,
+                                                                        Relation, parse_relation,
+                                                                        compile_triggering_text,
+                                                                        find_triggering_text)
+
+
+def named_entity(text, entity_text, label, start=0):
+    """
+    Create a named entity (as returned by named_entity_recognition) from its first occurrence in a text
+    :param text: text
+    :param entity_text: text of the named entity
+    :param label: label of the named entity
+    :param start: position from which the named entity is searched
+    :return: named entity
+    """
+    start_char = text.index(entity_text, start)
+    return {"text": entity_text, "start_char": start_char, "end_char": start_char + len(entity_text), "label": label}
 
 
 class TestRelationExtraction(unittest.TestCase):
@@ -52,6 +70,19 @@ class TestRelationExtraction(unittest.TestCase):
         self.assertEqual(sentence, " Under supplier request, the Purchaser will provide documents identified in this "
                                    "section except the external standards available on the market")
 
+    def test_get_sentence_start_for_position(self):
+        text = "Test 1. Test 2. Test 3. Test 45... Test 125"
+        sentence_index = create_sentence_index(text)
+        self.assertEqual(get_sentence_start_for_position(0, sentence_index), 0)
+        self.assertEqual(get_sentence_start_for_position(3, sentence_index), 0)
+        self.assertEqual(get_sentence_start_for_position(7, sentence_index), 0)
+        self.assertEqual(get_sentence_start_for_position(8, sentence_index), 7)
+        self.assertEqual(get_sentence_start_for_position(40, sentence_index), 34)
+        named_entity = {"text": "125", "start_char": 40, "end_char": 43, "label": "NUMBER"}
+        self.assertEqual(get_sentence_for_named_entity(named_entity, text, sentence_index), " Test 125")
+        self.assertEqual(associate_sentences_to_named_entities([named_entity], text),
+                         {0: [], 7: [], 15: [], 23: [], 34: [named_entity]})
+
     def test_get_sentence_start(self):
         text = "Test 1. Test 2. Test 3. Test 45... Test 125"
         sentences = sentence_segmentation(text)
@@ -103,6 +134,43 @@ class TestRelationExtraction(unittest.TestCase):
         has_more_specific_occurrence = has_more_specific_occurrence_in_triggering_text(text, triggering_text, sentence)
         self.assertEqual(has_more_specific_occurrence, True)
 
+    def test_find_triggering_text(self):
+        sentence = "The A380 is composed by the wing and the engines compose the propulsion."
+        triggering_text = [
+            {"text": "compose", "active": False},
+            {"text": "composed", "active": True}
+        ]
+        positions = find_triggering_text(compile_triggering_text(triggering_text), sentence)
+        # "compose" in "composed" is ignored, but not its later occurrence
+        self.assertEqual(positions, {"composed": 12, "compose": 49})
+        self.assertEqual(find_triggering_text(compile_triggering_text([]), sentence), {})
+
+    def test_extract_relation_in_later_sentence(self):
+        text = "The ECU is tested. The supplier provides the ECU."
+        named_entities = [named_entity(text, "ECU", "HARDWARE"), named_entity(text, "supplier", "ROLE"),
+                          named_entity(text, "ECU", "HARDWARE", 20)]
+        sentences = sentence_segmentation(text)
+        sentences_to_named_entities = associate_sentences_to_named_entities(named_entities, text)
+        # positions of triggering text are relative to the sentence start
+        relations = extract_relation("PROVIDE", sentences, sentences_to_named_entities, ["ROLE"], ["HARDWARE"],
+                                     [{"text": "provide", "active": True}])
+        self.assertEqual(relations, ["PROVIDE(supplier,ecu)"])
+
+    def test_extract_relation_with_less_specific_triggering_text(self):
+        text = "The A380 is composed by the wing and the engines compose the propulsion."
+        named_entities = [named_entity(text, entity, "COMPONENT") for entity in ["A380", "wing", "engines", "propulsion"]]
+        sentences = sentence_segmentation(text)
+        sentences_to_named_entities = associate_sentences_to_named_entities(named_entities, text)
+        triggering_text = [
+            {"text": "compose", "active": False},
+            {"text": "composed", "active": True}
+        ]
+        composition = extract_relation("COMPOSED_BY", sentences, sentences_to_named_entities, ["COMPONENT"],
+                                       ["COMPONENT"], triggering_text)
+        self.assertEqual(composition, ["COMPOSED_BY(propulsion,a380)", "COMPOSED_BY(propulsion,wing)",
+                                       "COMPOSED_BY(propulsion,engines)", "COMPOSED_BY(a380,wing)",
+                                       "COMPOSED_BY(a380,engines)", "COMPOSED_BY(a380,propulsion)"])
+
     def test_collaboration_extraction(self):
         model = "assets/ner_collins_en"
         text = ("The supplier provides the ECU. Under supplier request, the Purchaser will provide documents "
@@ -165,6 +233,16 @@ class TestRelationExtraction(unittest.TestCase):
         print("new PROVIDED relations created : ", provided)
 
 
+    def test_create_new_relations_from_existing_relations(self):
+        relations = ["COLLABORATION(supplier,purchaser)", Relation("RESPONSIBLE", "supplier", "ecu"),
+                     "RESPONSIBLE(purchaser,documents)", "RESPONSIBLE(purchaser,documents)"]
+        provided = create_new_relations_from_existing_relations(relations, "RESPONSIBLE", "right", "COLLABORATION",
+                                                                "right", "PROVIDED")
+        self.assertEqual(provided, ["PROVIDED(ecu,purchaser)"])
+        self.assertEqual(parse_relation("PROVIDED(documents,purchaser)"),
+                         Relation("PROVIDED", "documents", "purchaser"))
+        self.assertEqual(str(Relation("PROVIDED", "documents", "purchaser")), "PROVIDED(documents,purchaser)")
+
     def test_approval_extraction(self):
         model = "assets/ner_collins_en"
         text = ("The supplier will validate documents provided by the purchaser in accordance to appropriate criteria")
@@ -1,6 +1,7 @@
 import unittest
 
-from sapientia.nlp.preprocessing.data_cleaning import sentences_fixing, group_lists_in_sentences, sentences_cleaning
+from sapientia.nlp.preprocessing.data_cleaning import sentences_fixing, group_lists_in_sentences, sentences_cleaning, \
+    preprocessing_pipeline, iter_sentences_cleaning, CleaningRules
 
 
 class TestDataCleaning(unittest.TestCase):
@@ -26,6 +27,36 @@ class TestDataCleaning(unittest.TestCase):
         cleaned_sentences = sentences_cleaning(sentences)
         self.assertEqual(cleaned_sentences, ['1 apple, please.', 'This is a sentence'])
 
+    def test_sentences_cleaning_wrapped_headers(self):
+        sentences = ["CONFIDENTIAL AND PROPRIETARY\n DOCUMENT y", "Page \"5\" of 965 x", "Page 5 of\n 965 z"]
+        cleaned_sentences = sentences_cleaning(sentences)
+        self.assertEqual(cleaned_sentences, ['y', 'x', 'z'])
+
+    def test_preprocessing_pipeline(self):
+        sentences = iter(["", "This is a sentence (e.g", "cut in half", "this is the beginning of a list :",
+                          "• first item", ",", "• second item", "Page 5 of 965 This is another sentence"])
+        preprocessed_sentences = preprocessing_pipeline(sentences)
+        self.assertNotIsInstance(preprocessed_sentences, list)
+        self.assertEqual(list(preprocessed_sentences), ['This is a sentence (e.g. cut in half',
+                                                        'this is the beginning of a list : • first item • second item',
+                                                        'This is another sentence'])
+        preprocessed_sentences = preprocessing_pipeline(["", " a sentence"], stages=[iter_sentences_cleaning])
+        self.assertEqual(list(preprocessed_sentences), ['a sentence'])
+
+    def test_cleaning_rules(self):
+        rules = CleaningRules([
+            {"name": "line_breaks", "action": "remove", "pattern": "\n"},
+            {"name": "page_numbers", "action": "remove", "pattern": "Page [0-9]+ of [0-9]+", "regex": True},
+            {"name": "abbreviation", "action": "replace", "pattern": "EMA", "replacement": "actuator", "merge": False},
+            {"name": "footer", "action": "truncate", "pattern": "FOOTER"}
+        ], drop=[""])
+        cleaned_sentences = sentences_cleaning(["", "Page 5 of 965 The EMA\n moves. FOOTER Page 6 of 965"], rules)
+        self.assertEqual(cleaned_sentences, ['The actuator moves. '])
+        statistics = rules.statistics()
+        self.assertEqual(statistics["hits"], {"line_breaks": 1, "page_numbers": 2, "abbreviation": 1, "footer": 1})
+        self.assertEqual([cleaning_pass["rules"] for cleaning_pass in statistics["passes"]],
+                         [["line_breaks", "page_numbers"], ["abbreviation"], ["footer"]])
+
 
 if __name__ == '__main__':
     unittest.main()
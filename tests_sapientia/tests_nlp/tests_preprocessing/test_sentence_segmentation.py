@@ -0,0 +1,24 @@
+import unittest
+
+from sapientia.nlp.preprocessing.sentence_segmentation import sentence_spans, iter_sentences
+
+
+class TestSentenceSegmentation(unittest.TestCase):
+
+    def test_sentence_spans(self):
+        text = "  The supplier provides the ECU. The EMA shall move (e.g. left). See ref. 12 for details. Last one "
+        spans = list(sentence_spans(text))
+        self.assertEqual(spans, [(2, 32), (33, 64), (65, 89), (90, 99)])
+        self.assertEqual([text[start:end] for start, end in spans], ['The supplier provides the ECU.',
+                                                                     'The EMA shall move (e.g. left).',
+                                                                     'See ref. 12 for details.', 'Last one '])
+
+    def test_iter_sentences_with_abbreviations(self):
+        abbreviations = {"ECU": "Electronic Control Unit", "approx": "approximately"}
+        text = "The supplier provides the ECU. The weight is approx. two tons."
+        sentences = list(iter_sentences(text, abbreviations))
+        self.assertEqual(sentences, ['The supplier provides the ECU.', 'The weight is approx. two tons.'])
+
+
+if __name__ == '__main__':
+    unittest.main()
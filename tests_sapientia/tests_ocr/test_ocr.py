@@ -1,6 +1,35 @@
+import threading
 import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-from sapientia.ocr.ocr import parse
+from sapientia.ocr.ocr import parse, TikaClient, parse_many
+
+
+class StubTikaHandler(BaseHTTPRequestHandler):
+    """
+    Stub of an Apache Tika server returning the content of the files it receives
+    """
+    protocol_version = "HTTP/1.1"  # keep-alive connections
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.connections.add(self.client_address)
+        self.server.requests += 1
+        if self.server.failures > 0:  # simulate a server error
+            self.server.failures -= 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        content = ("\n" + body.decode("utf-8")).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=UTF-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
 
 
 class TestOCR(unittest.TestCase):
@@ -33,5 +62,40 @@ class TestOCR(unittest.TestCase):
         self.assertIn(content_test_file, parsed_content_test_file)
 
 
+class TestTikaClient(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("localhost", 0), StubTikaHandler)  # stands in for Tika on localhost:9998
+        self.server.connections = set()
+        self.server.requests = 0
+        self.server.failures = 0
+        self.server_address = "http://localhost:" + str(self.server.server_address[1]) + "/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_parse(self):
+        with TikaClient(self.server_address) as client:
+            parsed_content_test_file = client.parse("data/test_txt.txt")
+        self.assertIn("Fichier de test (Apache Tika)", parsed_content_test_file)
+
+    def test_parse_retries(self):
+        self.server.failures = 2
+        with TikaClient(self.server_address, backoff_factor=0) as client:
+            parsed_content_test_file = client.parse("data/test_txt.txt")
+        self.assertIn("Fichier de test (Apache Tika)", parsed_content_test_file)
+        self.assertEqual(self.server.requests, 3)
+
+    def test_parse_many(self):
+        files = ["data/test_txt.txt"] * 20
+        parsed = list(parse_many(files, server=self.server_address, max_in_flight=4))
+        self.assertEqual(len(parsed), 20)
+        for file, content in parsed:
+            self.assertEqual(file, "data/test_txt.txt")
+            self.assertIn("Fichier de test (Apache Tika)", content)
+        self.assertLessEqual(len(self.server.connections), 4)  # connections are reused
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,84 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from sapientia.ocr.parse_cache import ParseCache
+
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        self.parsed_files = []
+
+    def parse(self, file):
+        self.parsed_files.append(file)
+        with open(file, "r") as f:
+            return f.read()
+
+    def test_get_or_parse(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ParseCache(directory)
+            content = cache.get_or_parse("data/test_txt.txt", self.parse)
+            self.assertIn("Fichier de test (Apache Tika)", content)
+            self.assertEqual(cache.get_or_parse("data/test_txt.txt", self.parse), content)
+            self.assertEqual(self.parsed_files, ["data/test_txt.txt"])
+            # the cache is persisted on disk
+            self.assertEqual(ParseCache(directory).get_or_parse("data/test_txt.txt", self.parse), content)
+            self.assertEqual(self.parsed_files, ["data/test_txt.txt"])
+            # parser settings are part of the key
+            cache.get_or_parse("data/test_txt.txt", self.parse, settings={"service": "text"})
+            self.assertEqual(len(self.parsed_files), 2)
+
+    def test_compressed_storage(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ParseCache(directory, compress=True)
+            content = cache.get_or_parse("data/test_txt.txt", self.parse)
+            self.assertEqual(ParseCache(directory).get_or_parse("data/test_txt.txt", self.parse), content)
+            self.assertEqual(self.parsed_files, ["data/test_txt.txt"])
+
+    def test_lru_eviction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ParseCache(directory, max_size=12)
+            cache.put("a" * 64, "12345")
+            cache.put("b" * 64, "12345")
+            self.assertEqual(cache.get("a" * 64), "12345")  # "a" becomes the most recently used entry
+            cache.put("c" * 64, "12345")
+            self.assertIsNone(cache.get("b" * 64))
+            self.assertEqual(cache.get("a" * 64), "12345")
+            self.assertEqual(cache.get("c" * 64), "12345")
+            self.assertLessEqual(cache.size, 12)
+
+    def test_shared_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # caches of several processes, sharing the same directory
+            caches = [ParseCache(directory, max_size=12, scan_interval=1), ParseCache(directory, max_size=12,
+                                                                                    scan_interval=1)]
+            caches[0].put("a" * 64, "12345")
+            caches[1].put("a" * 64, "12345")
+            caches[1].put("b" * 64, "12345")
+            self.assertEqual(caches[0].get("b" * 64), "12345")
+            caches[0].put("c" * 64, "12345")
+            # the size is bounded across caches, "a" is the least recently used entry
+            self.assertIsNone(caches[1].get("a" * 64))
+            self.assertEqual(caches[1].get("c" * 64), "12345")
+            self.assertLessEqual(caches[0].size, 12)
+            self.assertEqual(caches[0].statistics()["hits"], 1)
+
+    def test_incremental_size(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ParseCache(directory, max_size=1000)
+            with mock.patch.object(cache, "scan_entries", wraps=cache.scan_entries) as scan_entries:
+                for i in range(50):
+                    cache.put(str(i) * 64, "12345")
+                self.assertEqual(scan_entries.call_count, 1)  # the cache directory is only scanned on the first put
+                self.assertEqual(cache.size, 250)
+                cache.remove("0" * 64)
+                self.assertEqual(cache.size, 245)
+                for i in range(50, 200):
+                    cache.put(str(i) * 64, "12345")
+                # scanned again when the cache is full, entries are evicted below the watermark
+                self.assertLess(scan_entries.call_count, 10)
+                self.assertLessEqual(cache.size, 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,28 @@
+import os
+import tempfile
 import unittest
+from unittest import mock
 
+from sapientia.io.io import load_files
 from sapientia.workflow.workflow import create_training_data
 
+specifications = {
+    "a.txt": "The supplier shall provide the ECU. The ECU is tested by the supplier. ",
+    "b.txt": "The purchaser will approve the documents. This section is informative. ",
+    "c/d.txt": "The actuator must move the spoiler. The spoiler should be monitored by the ECU. "
+}
+
+
+def parse_text_file(file, cache=None):
+    """
+    Parse stub reading text files (no Apache Tika server needed)
+    :param file: file path
+    :param cache: parse cache (not used)
+    :return: content of the file
+    """
+    with open(file, "r", encoding="utf8") as text_file:
+        return text_file.read()
+
 
 class TestWorkflow(unittest.TestCase):
     def test_create_training_data(self):
@@ -11,5 +32,81 @@ class TestWorkflow(unittest.TestCase):
         training_data.close()
 
 
+@mock.patch("sapientia.workflow.workflow.parse", parse_text_file)
+class TestWorkflowSourceTree(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source_dir = os.path.join(self.directory.name, "specifications")
+        self.target_file = os.path.join(self.directory.name, "training_data", "training_data.jsonl")
+        for name, content in specifications.items():
+            self.write_specification(name, content)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_specification(self, name, content):
+        path = os.path.join(self.source_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf8") as file:
+            file.write(content)
+
+    def read_training_data(self):
+        with open(self.target_file, "r") as training_data:
+            return training_data.read()
+
+    def test_create_training_data_parallel(self):
+        sequential_statistics = create_training_data(self.source_dir, self.target_file)
+        sequential_training_data = self.read_training_data()
+        parallel_statistics = create_training_data(self.source_dir, self.target_file, workers=2)
+        parallel_training_data = self.read_training_data()
+        self.assertEqual(sequential_statistics["files"], 3)
+        self.assertEqual(sequential_statistics["requirements"], 4)
+        self.assertEqual(parallel_training_data, sequential_training_data)
+        self.assertEqual(parallel_statistics["requirements"], sequential_statistics["requirements"])
+        self.assertIn("parse", parallel_statistics["stages"])
+
+    def test_create_training_data_incremental(self):
+        first_statistics = create_training_data(self.source_dir, self.target_file, incremental=True)
+        first_training_data = self.read_training_data()
+        self.assertEqual(first_statistics["reused"], 0)
+        self.assertEqual(first_statistics["requirements"], 4)
+        # unchanged files are reused
+        statistics = create_training_data(self.source_dir, self.target_file, incremental=True)
+        self.assertEqual(self.read_training_data(), first_training_data)
+        self.assertEqual(statistics["reused"], statistics["files"])
+
+    def test_create_training_data_incremental_modified_file(self):
+        create_training_data(self.source_dir, self.target_file, incremental=True)
+        self.write_specification("b.txt", "The purchaser will approve the documents. The supplier may use tools. ")
+        statistics = create_training_data(self.source_dir, self.target_file, incremental=True)
+        self.assertEqual(statistics["reused"], 2)  # only the modified file is parsed again
+        self.assertEqual(statistics["requirements"], 5)
+        self.assertIn("The supplier may use tools.", self.read_training_data())
+
+    def test_create_training_data_incremental_resume(self):
+        failing_file = load_files(self.source_dir)[-1]
+
+        def parse_text_file_failing(file, cache=None):  # simulates a crash in the middle of a build
+            if file == failing_file:
+                raise RuntimeError(file)
+            return parse_text_file(file)
+
+        with mock.patch("sapientia.workflow.workflow.parse", parse_text_file_failing):
+            with self.assertRaises(RuntimeError):
+                create_training_data(self.source_dir, self.target_file, incremental=True)
+        # the build resumes from the files processed before the crash
+        statistics = create_training_data(self.source_dir, self.target_file, incremental=True)
+        self.assertEqual(statistics["reused"], 2)
+        resumed_training_data = self.read_training_data()
+        create_training_data(self.source_dir, self.target_file)
+        self.assertEqual(resumed_training_data, self.read_training_data())
+
+    def test_create_training_data_incremental_settings(self):
+        create_training_data(self.source_dir, self.target_file, incremental=True)
+        statistics = create_training_data(self.source_dir, self.target_file, incremental=True,
+                                          abbreviations={"ECU": "Electronic Control Unit"})
+        self.assertEqual(statistics["reused"], 0)  # requirements are extracted again with the new settings
+
+
 if __name__ == '__main__':
     unittest.main()